@@ -1,34 +1,150 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, scrolledtext, filedialog, simpledialog
 import requests
 from duckduckgo_search import DDGS
 from moviepy.editor import *
 from moviepy.video.fx.all import resize as mv_resize  # Rename to avoid conflict
-from moviepy.video import fx as vfx
-from PIL import Image, ImageTk
+from moviepy.video.fx.all import colorx as mv_colorx
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from moviepy.config import get_setting
+import proglog
+from PIL import Image, ImageChops, ImageOps, ImageSequence, ImageTk
+import numpy as np
 import os
+import sys
 import threading
 import io
 import queue
 import time
 import uuid  # For unique filenames
+import hashlib
+import json
+import sqlite3
+import atexit
+import shutil
+import tempfile
+import argparse
+import platform
+import wave
+import bisect
+import contextlib
+import itertools
+import functools
+import logging
+import logging.handlers
+from collections import OrderedDict, Counter, namedtuple, deque
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import resource  # Peak RSS in the benchmark suite; Unix only
+except ImportError:
+    resource = None
 
 # --- Configuration ---
-MAX_THUMBNAILS_DISPLAY = 30         # Max results to show per search
+MAX_THUMBNAILS_DISPLAY = 30         # Max results to show per search page
+SEARCH_PAGE_SIZE = MAX_THUMBNAILS_DISPLAY + 10  # Candidates requested from each engine per page
+SCROLL_PREFETCH_ROWS = 2             # Load the next page when the viewport is this close to the last row
 THUMBNAIL_SIZE = (100, 100)          # Display size for thumbnails
+GRID_CELL = (THUMBNAIL_SIZE[0] + 10, THUMBNAIL_SIZE[1] + 10)  # Thumbnail grid cell incl. padding
+THUMBNAILS_PER_TICK = 8              # Max thumbnails added to the grid per 100 ms UI tick
 TARGET_DURATION_SEC = 60
 OUTPUT_VIDEO_FILENAME = "tiktok_gui_video.mp4"
 DOWNLOAD_FOLDER = "selected_images_gui"  # Store full selected images here
 VIDEO_RESOLUTION = (1080, 1920)      # TikTok's vertical aspect ratio (9:16)
+VIDEO_FPS = 24
+PREVIEW_VIDEO_FILENAME = "tiktok_gui_preview.mp4"
+PREVIEW_SCALE = 0.25                 # Preview resolution relative to VIDEO_RESOLUTION (270x480)
+PREVIEW_FPS = 12
+PREVIEW_PRESET = 'ultrafast'
+OUTPUT_PROFILES = {                  # libx264 settings per output profile; see tune_encoder()
+    "draft": {"preset": "veryfast", "crf": 28, "audio_bitrate": "96k", "tune_preset": True},
+    "standard": {"preset": "medium", "crf": 23, "audio_bitrate": "128k", "tune_preset": True},
+    "archival": {"preset": "slow", "crf": 17, "audio_bitrate": "256k", "tune_preset": False},
+}
+DEFAULT_PROFILE = "standard"
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+MAX_ENCODER_THREADS = 16             # libx264 gains little beyond this at our resolutions
+FADE_DURATION = 0.5                  # Global fade in/out at the start and end of the video
+STREAM_QUEUE_FRAMES = 8              # Frames buffered between the frame producer and the encoder
+SEGMENT_WORKERS = 0                  # >1: render in parallel segments stitched with ffmpeg concat
+INCREMENTAL_RENDER = False           # Reuse unchanged segments from SEGMENT_CACHE_FOLDER between renders
+OVERLAY_FONT = "Arial-Bold"          # ImageMagick font name for the text overlay
+OVERLAY_FONTSIZE = 70               # At VIDEO_RESOLUTION; scaled with the output height
+CLIP_ZOOM = 0.05                     # Ken Burns zoom: clips scale from 1.0 to 1.0 + CLIP_ZOOM
+FILTER_FACTORS = {"Vintage": 0.8, "Bright": 1.2}  # Color multipliers per filter option
 BING_API_KEY = ""                  # <<-- Enter your Bing API key here
+BING_ENDPOINT = "https://api.bing.microsoft.com/v7.0/images/search"
+BRAVE_ENDPOINT = "https://api.search.brave.com/images"
+
+CACHE_FOLDER = os.path.join(DOWNLOAD_FOLDER, "cache")  # Content-addressed thumbnail/full image cache
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Evict least recently used files above this size
+CACHE_MAX_AGE_SEC = 14 * 24 * 3600   # Evict files not used for this long
+CACHE_SWEEP_SEC = 3600               # How often puts check the age limit
+CACHE_FLUSH_SEC = 30                 # Write the cache index at most this stale (and at exit)...
+CACHE_FLUSH_CHANGES = 1000           # ...or after this many files added or removed, whichever comes first
+SEGMENT_CACHE_FOLDER = os.path.join(DOWNLOAD_FOLDER, "segments")  # Encoded segments for incremental renders
+SEGMENT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+SEGMENT_CACHE_VERSION = 1            # Bump when frame drawing changes so stale segments are not reused
+AUDIO_CACHE_FOLDER = os.path.join(DOWNLOAD_FOLDER, "audio")  # Trimmed, faded AAC background tracks
+AUDIO_CACHE_MAX_BYTES = 256 * 1024 * 1024
+AUDIO_LOOP_SHORT_TRACKS = True       # Loop music shorter than the video (False: pad with silence)
+BEAT_SAMPLE_RATE = 11025             # Beat detection works on mono audio at this rate
+BEAT_FRAME = 1024                    # STFT window (samples) for the onset envelope
+BEAT_HOP = 256                       # STFT hop (samples): ~23 ms envelope resolution
+BEAT_MIN_CLIP = 0.5                  # Shortest clip a beat snap may produce (seconds)
+BEAT_MIN_CLARITY = 2.5               # Beat grid onset strength vs. average below which a track counts as beatless
+BEAT_ANALYSIS_VERSION = 1            # Bump when detection changes so cached beat grids are recomputed
+
+INDEX_DB_PATH = os.path.join(DOWNLOAD_FOLDER, "index.sqlite3")  # Search results, assets and projects
+SEARCH_RESULT_TTL_SEC = 24 * 3600    # Reuse an engine's results for the same keywords this long
+AUTOSAVE_PROJECT = "__selection__"   # Hidden project holding the current selection across restarts
+
+DHASH_THRESHOLD = 6                  # Max differing dHash bits for two thumbnails to count as the same picture
+
+LOG_RING_LINES = 1000                # Lines kept in the log widget (and events buffered per GUI tick)
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024 # Rotating file log (--log-file): size per file
+LOG_FILE_BACKUPS = 3                 # ... and rotated files kept
+
+# --- Network Configuration ---
+FETCH_WORKERS = 8                    # Thumbnail download threads shared by all engines
+FETCH_PER_HOST = 6                   # Max concurrent requests to a single host
+FETCH_RETRIES = 2                    # Retries for connection errors / 429 / 5xx
+FETCH_BACKOFF = 0.3                  # Exponential backoff factor between retries (seconds)
+FETCH_TIMEOUT = (3.05, 10)           # (connect, read) timeouts in seconds
+PREFETCH_WORKERS = 2                 # Background full-image downloads for visible/hovered results
+PREFETCH_BYTES_PER_SEC = 4 * 1024 * 1024  # Bandwidth budget shared by all prefetch downloads
+FULL_IMAGE_MAX_BYTES = 40 * 1024 * 1024   # Refuse full images larger than this
+FULL_IMAGE_QUALITY = 92              # JPEG quality full images are re-encoded at after downscaling
 
 # --- Global Variables ---
-selected_files_info = {}  # Dictionary {widget_id: {'path': full_path, 'url': url, 'thumb_widget': widget}}
+selected_files_info = {}  # Dictionary {full_url: {'path': full_path, 'url': url}}, in selection order
+grid_items = []           # Search results in arrival order: [{'url', 'thumb_url', 'image': PIL thumbnail}]
+grid_cells = {}           # {index: {'photo', 'image_id', 'frame_id', 'selected'}} for the rows currently drawn
+grid_columns = 0          # Column count the drawn cells were laid out with
 root = None               # Main window reference
-status_queue = queue.Queue()  # Queue for status updates from threads
 image_queue = queue.Queue()   # Queue for thumbnail data from threads
 video_thread = None           # To check if video generation is running
 search_engine_var = None      # Will hold the current search engine selection
+current_search = None         # SearchSession whose results the grid shows
+_search_generations = itertools.count(1)
+_ddg_results = OrderedDict()  # LRU {keywords: (results listed so far, whether that was all)}
+_ddg_results_lock = threading.Lock()
+log_text = None               # Log widget (None when running headless)
+_http_session = None          # Shared keep-alive session, see get_http_session()
+_http_session_lock = threading.Lock()
+_fetch_pool = None            # Shared thumbnail worker pool, see get_fetch_pool()
+_host_slots = {}              # {host: BoundedSemaphore} per-host concurrency limits
+_image_cache = None           # Shared on-disk image cache, see get_image_cache()
+_prefetcher = None            # Background full-image downloader, see get_prefetcher()
+_store = None                 # SQLite search/asset/project index, see get_store()
+_overlay_tiles = {}           # {(text, font, fontsize, resolution): OverlayTile}
+_overlay_tiles_lock = threading.Lock()
+_file_digests = {}            # {(path, size, mtime): sha256}, see file_digest()
+_tracer = None                # Active Tracer while a traced render runs, see tracing()
 
 # --- Additional Viral Options Widgets (to be created in setup_gui) ---
 transition_style_var = None   # Dropdown: "Crossfade" or "None"
@@ -36,385 +152,2328 @@ transition_duration_var = None  # Transition duration in seconds (float)
 text_overlay_var = None       # Text overlay to be applied
 filter_var = None             # Filter option: "None", "Vintage", "Bright"
 bg_music_path_var = None      # Background music file path (string)
+incremental_var = None        # Checkbox: reuse unchanged segments from earlier renders
+profile_var = None            # Dropdown: output profile (OUTPUT_PROFILES)
+project_var = None            # Dropdown: saved project to open
+project_combo = None
+trace_var = None              # Checkbox: write a render trace next to the output
+beat_sync_var = None          # Checkbox: cut on the beats of the background music
 
-# --- Helper Functions (MoviePy part) ---
-def create_tiktok_video_threaded(image_files_list, output_filename, target_duration, resolution,
-                                 transition_style, transition_duration, overlay_text, filter_option, bg_music_path):
-    """Runs the video creation in a separate thread with viral options."""
-    global video_thread
-    status_queue.put(f"Starting video creation with {len(image_files_list)} images...")
+# --- Events (status and log messages from any thread) ---
+Event = namedtuple("Event", "time level message status thread")
+
+class EventBus:
+    """Thread-safe fan-in for status and log messages.
+
+    Publishing only appends to a bounded deque (plus any sinks, e.g. a rotating file), so
+    worker threads never touch Tk. The GUI drains it once per tick (see update_status_bar).
+    The deque holds the last `pending_size` events: more in one tick would be trimmed from
+    the log widget anyway, so older ones are dropped and drain() reports how many. Sinks
+    still see every event. Without a GUI attached, log lines are printed instead.
+    """
+
+    def __init__(self, pending_size=LOG_RING_LINES):
+        self.pending = deque(maxlen=pending_size)
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.sinks = []
+        self.ui_attached = False
+
+    def publish(self, message, level=logging.INFO, status=False):
+        event = Event(time.time(), level, str(message), status, threading.current_thread().name)
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(event)
+        for sink in self.sinks:
+            sink(event)
+        if not self.ui_attached and not status:
+            print(format_event(event))
+
+    def drain(self):
+        """Removes and returns every event published since the last drain, oldest first,
+        after a warning event if some were dropped."""
+        with self.lock:
+            events, dropped = list(self.pending), self.dropped
+            self.pending.clear()
+            self.dropped = 0
+        if dropped:
+            events.insert(0, Event(events[0].time, logging.WARNING,
+                                   f"{dropped} earlier log lines not shown (too many at once)", False, "log"))
+        return events
+
+    def add_file_sink(self, path, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS):
+        """Also appends every event to a size-rotated log file."""
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+        logger = logging.getLogger("tiktok_maker")
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.sinks.append(lambda event: logger.log(event.level, event.message))
+
+def format_event(event):
+    level = "" if event.level < logging.WARNING else logging.getLevelName(event.level) + " "
+    return f"{time.strftime('%H:%M:%S', time.localtime(event.time))} - {level}{event.message}"
+
+event_bus = EventBus()
+
+def post_status(message, level=logging.INFO):
+    """Shows message in the status bar and the log. Safe to call from any thread."""
+    event_bus.publish(message, level, status=True)
+
+def log_message(message, level=logging.INFO):
+    """Adds message to the log only. Safe to call from any thread."""
+    event_bus.publish(message, level)
+
+# --- Tracing ---
+class Tracer:
+    """Timed spans and counters for one render, exported as Chrome trace JSON.
+
+    Every span becomes a complete ("X") event with its pid and thread, so the file opens in
+    chrome://tracing or Perfetto with the frame producer, encoder and segment processes on
+    separate tracks. summary() aggregates the same spans per stage name.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.counters = Counter()
+        self.threads = {}             # {(pid, tid): thread name}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter_ns() - start, args)
+
+    def add(self, name, start_ns, duration_ns, args=None):
+        thread = threading.current_thread()
+        key = (os.getpid(), thread.native_id)
+        event = {"name": name, "ph": "X", "ts": start_ns / 1000, "dur": duration_ns / 1000,
+                 "pid": key[0], "tid": key[1]}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+            self.threads.setdefault(key, thread.name)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def merge(self, events, counters, threads):
+        """Adds spans recorded by a worker process (see run_traced())."""
+        with self.lock:
+            self.events.extend(events)
+            self.counters.update(counters)
+            self.threads.update(threads)
+
+    def chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+            counters = dict(self.counters)
+        origin = min((event["ts"] for event in events), default=0)
+        trace = [dict(event, ts=event["ts"] - origin) for event in events]
+        trace += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for (pid, tid), name in threads.items()]
+        if counters and events:
+            end = max(event["ts"] + event["dur"] for event in events) - origin
+            trace += [{"name": name, "ph": "C", "ts": end, "pid": events[0]["pid"], "args": {name: value}}
+                      for name, value in counters.items()]
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self):
+        """Per-stage table (calls, total, mean and max time), slowest stage first, then counters."""
+        stages = {}
+        with self.lock:
+            for event in self.events:
+                calls, total, longest = stages.get(event["name"], (0, 0.0, 0.0))
+                stages[event["name"]] = (calls + 1, total + event["dur"], max(longest, event["dur"]))
+            counters = sorted(self.counters.items())
+        lines = [f"{'stage':16s} {'calls':>7s} {'total s':>9s} {'mean ms':>9s} {'max ms':>9s}"]
+        for name, (calls, total, longest) in sorted(stages.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:16s} {calls:7d} {total / 1e6:9.2f} {total / calls / 1e3:9.2f} {longest / 1e3:9.2f}")
+        lines += [f"{name}: {value}" for name, value in counters]
+        return lines
+
+_NO_SPAN = contextlib.nullcontext()
+
+def trace_span(name, **args):
+    """Context manager timing one stage; a shared no-op object while tracing is off."""
+    return _NO_SPAN if _tracer is None else _tracer.span(name, **args)
+
+def trace_count(name, value=1):
+    if _tracer is not None:
+        _tracer.count(name, value)
+
+@contextlib.contextmanager
+def tracing(trace_path, status=print):
+    """Traces everything run inside the block and writes it to trace_path, reporting the
+    summary through status. Does nothing without a path or when a trace is already running."""
+    global _tracer
+    if not trace_path or _tracer is not None:
+        yield _tracer
+        return
+    tracer = _tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        _tracer = None
+        tracer.write(trace_path)
+        status(f"Render trace written to {trace_path}")
+        for line in tracer.summary():
+            status(line)
+
+TracedResult = namedtuple("TracedResult", "result events counters threads")
+
+def run_traced(func, *args):
+    """Process-pool entry point: runs func under a fresh Tracer and returns a TracedResult."""
+    global _tracer
+    tracer = _tracer = Tracer()
     try:
-        valid_image_files = [f for f in image_files_list if os.path.exists(f)]
-        if len(valid_image_files) != len(image_files_list):
-            status_queue.put(f"Warning: {len(image_files_list) - len(valid_image_files)} selected files not found. Proceeding with {len(valid_image_files)}.")
-        if not valid_image_files:
-            status_queue.put("Error: No valid image files found to create video.")
-            video_thread = None
+        return TracedResult(func(*args), tracer.events, dict(tracer.counters), tracer.threads)
+    finally:
+        _tracer = None
+
+def submit_traced(pool, func, *args):
+    """pool.submit(func, *args), collecting the worker's spans too while tracing is on."""
+    if _tracer is None:
+        return pool.submit(func, *args)
+    return pool.submit(run_traced, func, *args)
+
+def traced_result(future):
+    """future.result() for submit_traced() futures; merges the worker's spans into the trace."""
+    result = future.result()
+    if isinstance(result, TracedResult):
+        if _tracer is not None:
+            _tracer.merge(result.events, result.counters, result.threads)
+        result = result.result
+    return result
+
+# --- Frame Engine (decode once, one resample per frame) ---
+def filter_lut(filter_option):
+    """Image.point() lookup table for a color filter, or None for "None".
+
+    Same math as vfx.colorx (min(255, factor * value), truncated to uint8), but the multiply,
+    clip and cast collapse into a single table lookup per pixel.
+    """
+    factor = FILTER_FACTORS.get(filter_option)
+    if factor is None:
+        return None
+    return np.minimum(255, factor * np.arange(256)).astype(np.uint8).tolist() * 3
+
+def zoom_scale(t, duration, zoom=CLIP_ZOOM):
+    return 1 + zoom * (t / duration if duration else 1)
+
+def cover_crop(img, resolution):
+    """Scales and center-crops a PIL image so it exactly covers resolution (one Lanczos resample)."""
+    return ImageOps.fit(img, tuple(resolution), method=Image.LANCZOS, centering=(0.5, 0.5))
+
+def load_still(path, resolution):
+    """Decodes a still image once, cover-cropped to resolution, as an RGB PIL image.
+
+    JPEGs are decoded at the smallest DCT scale that still covers the target, and
+    transparent images are flattened onto black like MoviePy's compose does.
+    """
+    with Image.open(path) as img:
+        src_w, src_h = img.size
+        if src_w == 0 or src_h == 0:
+            raise ValueError(f"Invalid dimensions {img.size}")
+        cover = max(resolution[0] / src_w, resolution[1] / src_h)
+        img.draft("RGB", (int(src_w * cover) + 1, int(src_h * cover) + 1))
+        return cover_crop(flatten_rgb(img), resolution)
+
+def flatten_rgb(img):
+    """Converts a PIL image to RGB, compositing transparent images onto black."""
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (0, 0, 0))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    return img.convert("RGB")
+
+def zoom_frame(base, scale, lut=None, size=None):
+    """Returns base zoomed by `scale` around its center as a uint8 array, with the filter applied.
+
+    The zoom is a single bilinear resample of the visible box straight to the output size
+    (base's own size unless `size` is given), instead of resizing the full frame up and
+    cropping it back down.
+    """
+    w, h = base.size
+    size = tuple(size) if size else (w, h)
+    if scale != 1 or size != (w, h):
+        crop_w, crop_h = w / scale, h / scale
+        box = ((w - crop_w) / 2, (h - crop_h) / 2, (w + crop_w) / 2, (h + crop_h) / 2)
+        with trace_span("geometry"):
+            base = base.resize(size, Image.BILINEAR, box=box)
+    if lut is not None:
+        with trace_span("fx"):
+            base = base.point(lut)
+    return np.asarray(base)
+
+class StillFrameSource:
+    """Frame generator for one still-image clip: decoded and cover-cropped once, then each
+    frame is one zoom resample plus one filter lookup."""
+
+    def __init__(self, path, resolution, duration, filter_option="None", zoom=CLIP_ZOOM):
+        self.base = load_still(path, resolution)
+        self.duration = duration
+        self.zoom = zoom
+        self.lut = filter_lut(filter_option)
+
+    def get_frame(self, t):
+        return zoom_frame(self.base, zoom_scale(t, self.duration, self.zoom), self.lut)
+
+def cover_crop_native(img, resolution):
+    """Center-crops img to the target aspect ratio without upscaling; larger images are
+    scaled down to resolution so stored frames never exceed the output size."""
+    target_w, target_h = resolution
+    w, h = img.size
+    if w * target_h > h * target_w:
+        crop_w, crop_h = max(1, round(h * target_w / target_h)), h
+    else:
+        crop_w, crop_h = w, max(1, round(w * target_h / target_w))
+    if crop_w >= target_w:
+        return cover_crop(img, resolution)
+    left, top = (w - crop_w) // 2, (h - crop_h) // 2
+    return img.crop((left, top, left + crop_w, top + crop_h))
+
+class GifFrameStore:
+    """The frames of an animated GIF, decoded once with Pillow and cover-cropped.
+
+    Runs of identical consecutive frames are stored once with their summed delay, and
+    frames are looked up by timestamp, so serving a frame never touches the decoder.
+    Decoding stops at `until` seconds (the clip's length). Frames with at most 256 colors,
+    as most GIF frames are after a crop without scaling, are kept palette-encoded (one
+    byte per pixel) and expanded to RGB per lookup.
+    """
+
+    def __init__(self, path, resolution, until=None):
+        self.frames, self.ends = [], []
+        elapsed = 0.0
+        previous = None
+        with Image.open(path) as img:
+            for frame in ImageSequence.Iterator(img):
+                if until is not None and elapsed >= until:
+                    break
+                elapsed += (frame.info.get("duration") or 100) / 1000.0
+                rgba = frame.convert("RGBA")
+                # Transparent pixels show the black background, like the compose concatenation did.
+                rgb = Image.new("RGB", rgba.size, (0, 0, 0))
+                rgb.paste(rgba, mask=rgba.getchannel("A"))
+                rgb = cover_crop_native(rgb, resolution)
+                if previous is not None and ImageChops.difference(previous, rgb).getbbox() is None:
+                    self.ends[-1] = elapsed
+                    continue
+                previous = rgb
+                self.frames.append(self._compact(rgb))
+                self.ends.append(elapsed)
+        self.duration = elapsed
+
+    @staticmethod
+    def _compact(rgb):
+        """rgb as a "P" image with exactly its own colors, or rgb itself if it has more than 256."""
+        colors = rgb.getcolors(256)
+        if colors is None:
+            return rgb
+        pixels = np.asarray(rgb, dtype=np.uint32)
+        keys = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        palette = np.array(sorted((r << 16) | (g << 8) | b for _, (r, g, b) in colors), dtype=np.uint32)
+        paletted = Image.fromarray(np.searchsorted(palette, keys).astype(np.uint8), "P")
+        paletted.putpalette(np.stack([palette >> 16, (palette >> 8) & 255, palette & 255], axis=1)
+                            .astype(np.uint8).tobytes())
+        return paletted
+
+    def frame_at(self, t):
+        frame = self.frames[min(bisect.bisect_right(self.ends, t), len(self.frames) - 1)]
+        return frame.convert("RGB") if frame.mode == "P" else frame
+
+def gif_duration(path):
+    """Animation length of a GIF in seconds, from its frame delays (as GifFrameStore counts
+    them: no delay means 100 ms). Walks the block structure without decoding any pixels,
+    falling back to Pillow for files it can't parse."""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        if data[:3] != b"GIF":
+            raise ValueError("not a GIF")
+        pos = 13 + (3 << ((data[10] & 7) + 1) if data[10] & 0x80 else 0)
+        total_ms = delay = 0
+        while data[pos] != 0x3B:
+            if data[pos] == 0x21:       # Extension; a graphic control block carries the next frame's delay
+                if data[pos + 1] == 0xF9 and data[pos + 2] >= 4:
+                    delay = int.from_bytes(data[pos + 4:pos + 6], "little") * 10
+                pos += 2
+            elif data[pos] == 0x2C:     # Image descriptor, local color table, LZW code size
+                packed = data[pos + 9]
+                pos += 11 + (3 << ((packed & 7) + 1) if packed & 0x80 else 0)
+                total_ms += delay or 100
+                delay = 0
+            else:
+                raise ValueError("unknown block")
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        return total_ms / 1000.0
+    except (ValueError, IndexError):
+        with Image.open(path) as img:
+            return sum((frame.info.get("duration") or 100) for frame in ImageSequence.Iterator(img)) / 1000.0
+
+class GifFrameSource:
+    """Frame generator for one animated GIF clip, served from its own decoded frame store,
+    which close() frees when the clip is over (see Timeline.release_before)."""
+
+    def __init__(self, path, resolution, duration, filter_option="None", zoom=CLIP_ZOOM):
+        self.store = GifFrameStore(path, resolution, until=duration)
+        self.resolution = tuple(resolution)
+        self.duration = duration
+        self.zoom = zoom
+        self.lut = filter_lut(filter_option)
+
+    def get_frame(self, t):
+        return zoom_frame(self.store.frame_at(t), zoom_scale(t, self.duration, self.zoom), self.lut,
+                          self.resolution)
+
+    def close(self):
+        self.store = None
+
+class OverlayTile:
+    """A caption rasterized once and cropped to the bounding box of its visible pixels.
+
+    Colors are stored premultiplied by alpha, so blending a frame is one multiply-add over
+    the tile's box instead of an alpha composite over the whole frame.
+    """
+
+    def __init__(self, rgb, alpha):
+        ys, xs = np.nonzero(alpha > 0)
+        if len(ys) == 0:
+            self.x = self.y = 0
+            self.premultiplied = self.inv_alpha = None
             return
+        self.y, self.x = int(ys.min()), int(xs.min())
+        y1, x1 = int(ys.max()) + 1, int(xs.max()) + 1
+        alpha = alpha[self.y:y1, self.x:x1, None].astype(np.float32)
+        self.premultiplied = rgb[self.y:y1, self.x:x1].astype(np.float32) * alpha
+        self.inv_alpha = 1 - alpha
+
+    def blend(self, frame):
+        """Composites the tile onto frame in place (frame must be writable) and returns it."""
+        if self.premultiplied is None:
+            return frame
+        h, w = self.inv_alpha.shape[:2]
+        region = frame[self.y:self.y + h, self.x:self.x + w]
+        region[...] = region * self.inv_alpha + self.premultiplied
+        return frame
 
-        clips = []
-        duration_per_clip = max(1.0, target_duration / len(valid_image_files))
-        status_queue.put(f"Aiming for ~{duration_per_clip:.2f} seconds per clip.")
+def overlay_fontsize(resolution):
+    """OVERLAY_FONTSIZE scaled to the output height, so previews keep the same layout."""
+    return max(8, round(OVERLAY_FONTSIZE * resolution[1] / VIDEO_RESOLUTION[1]))
 
-        for i, img_path in enumerate(valid_image_files):
+def get_overlay_tile(overlay_text, resolution, font=OVERLAY_FONT, fontsize=None):
+    """Returns the cached OverlayTile for this caption, rasterizing it on first use."""
+    fontsize = fontsize or overlay_fontsize(resolution)
+    key = (overlay_text, font, fontsize, tuple(resolution))
+    with _overlay_tiles_lock:
+        tile = _overlay_tiles.get(key)
+        if tile is None:
+            txt_clip = TextClip(overlay_text, fontsize=fontsize, color='white', font=font,
+                                size=tuple(resolution), method='caption', align='South')
             try:
-                status_queue.put(f"Processing clip {i+1}/{len(valid_image_files)}: {os.path.basename(img_path)}")
-                if img_path.lower().endswith(".gif"):
-                    clip = VideoFileClip(img_path, target_resolution=(None, resolution[1]), has_mask=True)
-                    actual_clip_duration = min(duration_per_clip, clip.duration if clip.duration else duration_per_clip)
-                    if actual_clip_duration < 0.1:
-                        actual_clip_duration = 0.5
-                    clip = clip.set_duration(actual_clip_duration)
-                else:
-                    clip = ImageClip(img_path, duration=duration_per_clip)
-                
-                # Resize & Crop to Fit TikTok Aspect Ratio
-                clip_w, clip_h = clip.size
-                target_w, target_h = resolution
-                if clip_w == 0 or clip_h == 0:
-                    status_queue.put(f"Warning: Invalid dimensions for {img_path}. Skipping.")
+                tile = _overlay_tiles[key] = OverlayTile(txt_clip.get_frame(0), txt_clip.mask.get_frame(0))
+            finally:
+                txt_clip.close()
+        return tile
+
+class Timeline:
+    """Everything needed to draw any frame of a video, as plain data.
+
+    entries are clips on a global time axis ({'path', 'kind', 'start', 'duration', 'crossfade'});
+    a clip with crossfade > 0 fades in over the previous one during its first `crossfade`
+    seconds. Sources are opened on first use, so a Timeline can be pickled into worker
+    processes that each draw only part of it.
+    """
+
+    def __init__(self, entries, resolution, filter_option="None", overlay_text="", fade=FADE_DURATION):
+        self.entries = entries
+        self.resolution = tuple(resolution)
+        self.filter_option = filter_option
+        self.overlay_text = overlay_text.strip()
+        self.fade = fade
+        self.duration = max(entry["start"] + entry["duration"] for entry in entries) if entries else 0
+        self.starts = [entry["start"] for entry in entries]
+        self.sources = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["sources"] = {}
+        return state
+
+    def source(self, index):
+        source = self.sources.get(index)
+        if source is None:
+            entry = self.entries[index]
+            source_class = GifFrameSource if entry["kind"] == "gif" else StillFrameSource
+            with trace_span("load", file=os.path.basename(entry["path"]), kind=entry["kind"]):
+                source = self.sources[index] = source_class(entry["path"], self.resolution, entry["duration"],
+                                                            self.filter_option)
+        return source
+
+    def active(self, t):
+        """Indices of the clips visible at time t, bottom layer first."""
+        last = bisect.bisect_right(self.starts, t) - 1
+        return [i for i in (last - 1, last)
+                if i >= 0 and self.entries[i]["start"] <= t < self.entries[i]["start"] + self.entries[i]["duration"]]
+
+    def get_frame(self, t):
+        active = self.active(t)
+        if not active:
+            return np.zeros((self.resolution[1], self.resolution[0], 3), dtype=np.uint8)
+        frame = self.source(active[-1]).get_frame(t - self.entries[active[-1]]["start"])
+        if len(active) == 2:
+            top = self.entries[active[1]]
+            alpha = (t - top["start"]) / top["crossfade"] if top["crossfade"] else 1.0
+            below = self.source(active[0]).get_frame(t - self.entries[active[0]]["start"])
+            with trace_span("transition"):
+                frame = below * np.float32(1 - alpha) + frame * np.float32(alpha)
+        if self.fade:
+            brightness = min(1.0, t / self.fade, (self.duration - t) / self.fade)
+            if brightness < 1:
+                with trace_span("fade"):
+                    frame = frame * np.float32(max(0.0, brightness))
+        if self.overlay_text:
+            with trace_span("overlay"):
+                if not frame.flags.writeable:
+                    frame = frame.copy()
+                get_overlay_tile(self.overlay_text, self.resolution).blend(frame)
+        return frame if frame.dtype == np.uint8 else frame.astype(np.uint8)
+
+    def segments(self):
+        """(t0, t1, kind) intervals split at every clip start and end.
+
+        Crossfade overlaps come out as their own short 'transition' intervals.
+        """
+        points = sorted({0.0, self.duration} | {entry["start"] for entry in self.entries}
+                        | {entry["start"] + entry["duration"] for entry in self.entries})
+        return [(t0, t1, "transition" if len(self.active((t0 + t1) / 2)) > 1 else "clip")
+                for t0, t1 in zip(points, points[1:]) if t1 > t0]
+
+    def segment_key(self, times, encoder):
+        """Cache key for the frames at `times` (one segment): hashes the contents of the visible
+        sources and every option that changes those pixels or their encoding."""
+        t0, t1 = float(times[0]), float(times[-1])
+        layers = []
+        for i in sorted(set(self.active(t0)) | set(self.active(t1))):
+            entry = self.entries[i]
+            layers.append([file_digest(entry["path"]), entry["kind"], entry["duration"], entry["crossfade"],
+                           round(t0 - entry["start"], 6)])
+        fade = None
+        if self.fade and (t0 < self.fade or t1 > self.duration - self.fade):
+            fade = [self.fade, round(t0, 6), round(self.duration, 6)]
+        overlay = [self.overlay_text, OVERLAY_FONT, overlay_fontsize(self.resolution)] if self.overlay_text else None
+        payload = json.dumps([SEGMENT_CACHE_VERSION, layers, len(times), list(self.resolution), self.filter_option,
+                              CLIP_ZOOM, overlay, fade, list(encoder)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def release_before(self, t):
+        """Closes sources whose clip ended before t; the streaming renderer calls this as it goes."""
+        for index in [i for i in self.sources if self.entries[i]["start"] + self.entries[i]["duration"] <= t]:
+            source = self.sources.pop(index)
+            if hasattr(source, "close"):
+                source.close()
+
+    def close(self):
+        for source in self.sources.values():
+            if hasattr(source, "close"):
+                source.close()
+        self.sources = {}
+
+def frame_times(duration, fps):
+    """Timestamps of every output frame, exactly as MoviePy's iter_frames() produces them."""
+    return np.arange(0, duration, 1.0 / fps)
+
+def build_timeline(image_files, target_duration, resolution, transition_style, transition_duration,
+                   filter_option, overlay_text, status, beats=None):
+    """Lays the images out on a Timeline, skipping files that can't be read.
+
+    With `beats` (sorted times in seconds), each clip ends on the beat nearest its planned
+    end, so hard cuts land on a beat and crossfades finish on one.
+    """
+    duration_per_clip = max(1.0, target_duration / len(image_files))
+    status(f"Aiming for ~{duration_per_clip:.2f} seconds per clip.")
+    entries = []
+    for i, img_path in enumerate(image_files):
+        try:
+            status(f"Processing clip {i+1}/{len(image_files)}: {os.path.basename(img_path)}")
+            with Image.open(img_path) as img:
+                if img.width == 0 or img.height == 0:
+                    status(f"Warning: Invalid dimensions for {img_path}. Skipping.")
                     continue
-                if clip_w / clip_h > target_w / target_h:
-                    clip = clip.resize(height=target_h)
-                    clip = clip.crop(x_center=clip.w/2, width=target_w)
-                else:
-                    clip = clip.resize(width=target_w)
-                    clip = clip.crop(y_center=clip.h/2, height=target_h)
-                clip = clip.resize(resolution)
-                
-                # Apply subtle zoom effect
-                duration_val = clip.duration
-                clip = clip.fx(mv_resize, lambda t: 1 + 0.05 * (t / duration_val if duration_val else 1))
-                
-                # Apply selected filter
-                if filter_option == "Vintage":
-                    clip = clip.fx(vfx.colorx, 0.8)
-                elif filter_option == "Bright":
-                    clip = clip.fx(vfx.colorx, 1.2)
-                
-                clips.append(clip)
-            except Exception as e:
-                status_queue.put(f"Error processing {os.path.basename(img_path)}: {e}. Skipping.")
+            kind = "gif" if img_path.lower().endswith(".gif") else "still"
+            duration = longest = duration_per_clip
+            if kind == "gif":
+                # Only the length here; the frames are decoded when the clip is drawn
+                longest = gif_duration(img_path) or duration_per_clip
+                duration = min(duration_per_clip, longest)
+                if duration < 0.1:
+                    duration = 0.5
+                longest = max(duration, longest)
+            crossfade = 0.0
+            start = 0.0
+            if entries:
+                previous = entries[-1]
+                if transition_style == "Crossfade":
+                    crossfade = max(0.0, min(transition_duration, previous["duration"] / 2, duration / 2))
+                start = previous["start"] + previous["duration"] - crossfade
+            if beats is not None:
+                # A GIF clip may only end early: past its last frame it would freeze
+                duration = snap_to_beat(beats, start, duration, max(BEAT_MIN_CLIP, 2 * crossfade),
+                                        None if kind == "still" else longest)
+            entries.append({"path": img_path, "kind": kind, "start": start, "duration": duration,
+                            "crossfade": crossfade})
+        except Exception as e:
+            status(f"Error processing {os.path.basename(img_path)}: {e}. Skipping.")
+    return Timeline(entries, resolution, filter_option, overlay_text)
+
+# --- Streaming Renderer ---
+def stream_frames(timeline, times, writer, logger=None):
+    """Draws frames on a producer thread and feeds them to writer (ffmpeg's stdin) through a
+    bounded queue.
+
+    Sources are opened when their clip starts and closed as soon as it ends, so memory stays
+    flat however many images the timeline has.
+    """
+    frames = queue.Queue(maxsize=STREAM_QUEUE_FRAMES)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for t in times:
+                if stop.is_set():
+                    return
+                timeline.release_before(t)
+                with trace_span("frame"):
+                    frame = timeline.get_frame(t)
+                trace_count("frames")
+                frames.put(frame)
+        except Exception as e:
+            frames.put(e)
+
+    producer = threading.Thread(target=produce, daemon=True, name="frame-producer")
+    producer.start()
+    try:
+        for _ in proglog.default_bar_logger(logger).iter_bar(t=times):
+            with trace_span("frame_wait"):
+                frame = frames.get()
+            if isinstance(frame, Exception):
+                raise frame
+            with trace_span("encode"):
+                writer.write_frame(frame)
+    finally:
+        stop.set()
+        while producer.is_alive():  # Unblock a producer waiting on a full queue
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                producer.join(0.05)
+        timeline.close()
+
+def tune_encoder(profile=DEFAULT_PROFILE, concurrent=1, preset=None, cpus=None):
+    """Encoder settings for one render: {'preset', 'crf', 'audio_bitrate', 'threads'}.
+
+    The host's cores are split evenly between the `concurrent` encodes sharing it, and
+    profiles that allow it step to a faster preset when each encode gets fewer than four
+    cores, which keeps aggregate throughput up when many renders share one machine. An
+    explicit preset always wins.
+    """
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile '{profile}' (choose from {', '.join(OUTPUT_PROFILES)})")
+    settings = dict(OUTPUT_PROFILES[profile])
+    cores = max(1, (cpus or os.cpu_count() or 1) // max(1, concurrent))
+    settings["threads"] = min(cores, MAX_ENCODER_THREADS)
+    tune_preset = settings.pop("tune_preset")
+    if preset:
+        settings["preset"] = preset
+    elif tune_preset and cores < 4:
+        steps = 1 if cores >= 2 else 2
+        settings["preset"] = X264_PRESETS[max(0, X264_PRESETS.index(settings["preset"]) - steps)]
+    return settings
+
+def video_writer(path, timeline, fps, encoder, audio_path=None):
+    """FFMPEG_VideoWriter for libx264 with the given tune_encoder() settings."""
+    return FFMPEG_VideoWriter(path, timeline.resolution, fps, codec='libx264', audiofile=audio_path,
+                              preset=encoder["preset"], threads=encoder["threads"],
+                              ffmpeg_params=["-crf", str(encoder["crf"])])
+
+def write_timeline(timeline, output_filename, fps=VIDEO_FPS, audio_path=None, encoder=None, logger=None):
+    """Streams the whole timeline into one libx264 encode."""
+    writer = video_writer(output_filename, timeline, fps, encoder or tune_encoder(), audio_path)
+    try:
+        stream_frames(timeline, frame_times(timeline.duration, fps), writer, logger)
+    finally:
+        with trace_span("encode_flush"):
+            writer.close()
+
+# --- Parallel Segment Rendering ---
+def get_ffmpeg_binary():
+    return get_setting("FFMPEG_BINARY")
+
+def render_segment(timeline, frame_start, frame_stop, fps, path, encoder):
+    """Worker entry point: encodes frames [frame_start, frame_stop) of the timeline to path."""
+    times = frame_times(timeline.duration, fps)[frame_start:frame_stop]
+    with trace_span("segment", frames=len(times)):
+        writer = video_writer(path, timeline, fps, encoder)
+        try:
+            stream_frames(timeline, times, writer)
+        finally:
+            with trace_span("encode_flush"):
+                writer.close()
+    return path
+
+def concat_segments(segment_paths, output_filename, work_dir, audio_path=None, duration=None):
+    """Joins encoded segments losslessly (concat demuxer, stream copy), muxing in an AAC track
+    from AudioCache by stream copy too."""
+    list_path = os.path.join(work_dir, "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", "copy", "-t", f"{duration:.3f}"]
+    cmd += ["-c:v", "copy", "-movflags", "+faststart", output_filename]
+    with trace_span("concat", segments=len(segment_paths)):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {result.stderr.decode(errors='replace').strip()}")
+
+class SegmentCache:
+    """Encoded timeline segments on disk, one `<key>.mp4` per Timeline.segment_key().
+
+    Lookups are a single exists() check and refresh the file's mtime; evict() removes the
+    least recently used files once the folder is over max_bytes. Files are moved in with an
+    atomic rename, so several render processes can share the folder.
+    """
+
+    def __init__(self, folder=SEGMENT_CACHE_FOLDER, max_bytes=SEGMENT_CACHE_MAX_BYTES, extension=".mp4"):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.extension = extension
+        os.makedirs(folder, exist_ok=True)
+
+    def get(self, key):
+        path = os.path.join(self.folder, key + self.extension)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, segment_path):
+        """Moves a freshly encoded segment into the cache and returns its cached path."""
+        path = os.path.join(self.folder, key + self.extension)
+        tmp_path = os.path.join(self.folder, f".{key}.{uuid.uuid4().hex}.tmp")
+        shutil.move(segment_path, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def evict(self, keep=()):
+        """Drops least recently used segments until the folder fits max_bytes, never touching `keep`."""
+        keep = {os.path.abspath(path) for path in keep}
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith(self.extension) and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(path) in keep:
                 continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
 
-        if not clips:
-            status_queue.put("Error: No clips were successfully created.")
-            video_thread = None
-            return
+class AudioCache(SegmentCache):
+    """Background tracks trimmed to a video's length, faded and encoded to AAC once.
+
+    Keyed by (file hash, duration, fade, bitrate), so the many videos sharing a track and
+    length reuse one file, which renders mux in by stream copy instead of decoding and
+    re-encoding the whole track every time.
+    """
 
-        # Apply transitions based on selected style
-        if transition_style == "Crossfade":
-            final_clip = concatenate_videoclips(clips, method="compose", padding=-transition_duration)
+    def __init__(self, folder=AUDIO_CACHE_FOLDER, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        super().__init__(folder, max_bytes, extension=".m4a")
+
+    def prepare(self, music_path, duration, fade=FADE_DURATION, bitrate="128k", loop=AUDIO_LOOP_SHORT_TRACKS):
+        """Returns the path of the AAC track for music_path, encoding it on a cache miss.
+
+        Tracks shorter than `duration` are looped (or padded with silence when loop=False).
+        """
+        duration = round(duration, 3)
+        payload = json.dumps([file_digest(music_path), duration, fade, bitrate, loop])
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        path = self.get(key)
+        if path:
+            trace_count("audio_cache_hits")
+            return path
+        filters = [] if loop else ["apad"]
+        if fade:
+            filters += [f"afade=t=in:d={fade}", f"afade=t=out:st={max(0.0, duration - fade):.3f}:d={fade}"]
+        tmp_path = os.path.join(self.folder, f".{key}.{uuid.uuid4().hex}.m4a")
+        cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error"] + (["-stream_loop", "-1"] if loop else [])
+        cmd += ["-i", music_path, "-t", f"{duration:.3f}", "-vn"] + (["-af", ",".join(filters)] if filters else [])
+        cmd += ["-c:a", "aac", "-b:a", bitrate, "-ar", "44100", tmp_path]
+        with trace_span("audio", file=os.path.basename(music_path)):
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise RuntimeError(f"ffmpeg audio encode failed: {result.stderr.decode(errors='replace').strip()}")
+        path = self.put(key, tmp_path)
+        self.evict(keep=[path])
+        return path
+
+def render_segments(timeline, output_filename, workers, status, audio_path=None,
+                    fps=VIDEO_FPS, encoder=None, cache=None):
+    """Renders the timeline segment by segment and stitches the segments with ffmpeg concat.
+
+    With workers > 1, segments are encoded in separate processes. With a SegmentCache, only
+    segments whose key is missing are encoded; the rest are re-muxed from the cache.
+    """
+    encoder = encoder or tune_encoder(concurrent=workers)
+    times = frame_times(timeline.duration, fps)
+    ranges = []
+    for t0, t1, kind in timeline.segments():
+        frame_start, frame_stop = np.searchsorted(times, [t0, t1], side="left")
+        if frame_stop > frame_start:
+            ranges.append((int(frame_start), int(frame_stop), kind))
+    work_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(os.path.abspath(output_filename)))
+    segment_paths = [None] * len(ranges)
+    todo = []
+    for n, (frame_start, frame_stop, kind) in enumerate(ranges):
+        key = timeline.segment_key(times[frame_start:frame_stop],
+                                   ("libx264", encoder["preset"], encoder["crf"], fps)) if cache else None
+        cached = cache.get(key) if cache else None
+        if cached:
+            segment_paths[n] = cached
         else:
-            final_clip = concatenate_videoclips(clips, method="compose")
-
-        final_clip = final_clip.fadein(0.5).fadeout(0.5)
-
-        # Apply text overlay if provided
-        if overlay_text.strip():
-            txt_clip = TextClip(overlay_text, fontsize=70, color='white', font="Arial-Bold",
-                                size=resolution, method='caption', align='South').set_duration(final_clip.duration)
-            final_clip = CompositeVideoClip([final_clip, txt_clip])
-
-        # Add background music if a valid file is provided
-        if bg_music_path and os.path.exists(bg_music_path):
-            audio_clip = AudioFileClip(bg_music_path).subclip(0, final_clip.duration)
-            final_clip = final_clip.set_audio(audio_clip)
-
-        status_queue.put(f"Writing video file: {output_filename}...")
-        final_clip.write_videofile(output_filename,
-                                   codec='libx264', audio_codec='aac',
-                                   temp_audiofile='temp-audio.m4a', remove_temp=True,
-                                   fps=24, preset='medium', threads=4,
-                                   logger='bar')
-
-        for clip in clips:
-            clip.close()
-        if final_clip:
-            final_clip.close()
-
-        status_queue.put(f"Success! Video saved as {output_filename}")
-    except Exception as e:
-        status_queue.put(f"FATAL VIDEO ERROR: {e}")
+            todo.append((n, frame_start, frame_stop, key))
+    trace_count("segments_cached", len(ranges) - len(todo))
+    trace_count("segments_encoded", len(todo))
+    if cache:
+        status(f"Reusing {len(ranges) - len(todo)} cached segments, rendering {len(todo)} of {len(ranges)}...")
+    else:
+        status(f"Rendering {len(ranges)} segments on {workers} processes...")
+
+    def finish(n, path, key):
+        segment_paths[n] = cache.put(key, path) if cache else path
+
+    try:
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {submit_traced(pool, render_segment, timeline, frame_start, frame_stop, fps,
+                                         os.path.join(work_dir, f"segment_{n:04d}.mp4"), encoder): (n, key)
+                           for n, frame_start, frame_stop, key in todo}
+                for done, future in enumerate(as_completed(futures), 1):
+                    n, key = futures[future]
+                    finish(n, traced_result(future), key)
+                    status(f"Encoded segment {done}/{len(todo)}")
+        else:
+            for done, (n, frame_start, frame_stop, key) in enumerate(todo, 1):
+                path = render_segment(timeline, frame_start, frame_stop, fps,
+                                      os.path.join(work_dir, f"segment_{n:04d}.mp4"), encoder)
+                finish(n, path, key)
+                status(f"Encoded segment {done}/{len(todo)}")
+        status("Stitching segments...")
+        concat_segments(segment_paths, output_filename, work_dir, audio_path, timeline.duration)
+        if cache:
+            cache.evict(keep=segment_paths)
     finally:
-        video_thread = None
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-# --- Multi-Engine Image Search Functions ---
-def fetch_images_duckduckgo(keywords):
-    status_queue.put(f"Searching DuckDuckGo for '{keywords}'...")
+# --- Beat Detection ---
+def decode_audio_mono(path, sample_rate=BEAT_SAMPLE_RATE):
+    """Decodes an audio file with ffmpeg to mono float32 samples at sample_rate."""
+    cmd = [get_ffmpeg_binary(), "-loglevel", "error", "-i", path, "-vn", "-ac", "1", "-ar", str(sample_rate),
+           "-f", "f32le", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg audio decode failed: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def onset_envelope(samples, sample_rate=BEAT_SAMPLE_RATE, frame=BEAT_FRAME, hop=BEAT_HOP, block=2048):
+    """Spectral-flux onset strength, one value per hop, normalized to [0, 1].
+
+    The STFT runs over `block` frames at a time (one rfft call each), so memory stays
+    bounded for long tracks. Value i describes the change into frame i + 1.
+    """
+    if len(samples) < frame + hop:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop]
+    window = np.hanning(frame).astype(np.float32)
+    flux = np.empty(len(frames) - 1, dtype=np.float32)
+    previous = None
+    for first in range(0, len(frames), block):
+        spectrum = np.log1p(100 * np.abs(np.fft.rfft(frames[first:first + block] * window, axis=1))).astype(np.float32)
+        if previous is not None:
+            spectrum = np.vstack([previous, spectrum])
+        flux[max(0, first - 1):first + block - 1] = np.maximum(0, np.diff(spectrum, axis=0)).sum(axis=1)
+        previous = spectrum[-1:]
+    # Subtract the local mean (~0.5 s) so sustained loudness doesn't read as onsets
+    width = max(1, int(0.5 * sample_rate / hop))
+    envelope = np.maximum(0, flux - np.convolve(flux, np.ones(width, dtype=np.float32) / width, mode="same"))
+    peak = envelope.max()
+    return envelope / peak if peak > 0 else envelope
+
+def estimate_beat_period(envelope, frames_per_sec, min_bpm=60, max_bpm=180):
+    """Beat period in envelope frames (fractional), or None for a track too short to tell.
+
+    Autocorrelation of the onset envelope (via FFT), weighted by a log-normal prior around
+    120 BPM so half and double tempo only win with clearly more support.
+    """
+    n = len(envelope)
+    low, high = int(frames_per_sec * 60 / max_bpm), min(n - 2, int(np.ceil(frames_per_sec * 60 / min_bpm)))
+    if low < 1 or high <= low + 2:
+        return None
+    spectrum = np.fft.rfft(envelope - envelope.mean(), 2 * n)
+    autocorr = np.fft.irfft(np.abs(spectrum) ** 2)[:n]
+    lags = np.arange(low, high + 1)
+    bpm = 60 * frames_per_sec / lags
+    score = autocorr[low:high + 1] * np.exp(-0.5 * np.log2(bpm / 120) ** 2)
+    k = int(np.argmax(score))
+    if score[k] <= 0:
+        return None
+    period = float(lags[k])
+    if 0 < k < len(score) - 1:
+        a, b, c = score[k - 1:k + 2]
+        if a - 2 * b + c:
+            period += 0.5 * (a - c) / (a - 2 * b + c)
+    return period
+
+def track_beats(envelope, period, spread=0.03, steps=61):
+    """(beat positions as envelope frame indices, clarity) for a steady tempo near `period`.
+
+    Periods within `spread` of the estimate and every phase are scored at once against a
+    lightly smoothed envelope; the grid landing on the most onset strength per beat wins
+    (the autocorrelation lag alone is too coarse and would drift over a whole track). Each
+    beat then moves to the strongest onset within 10% of a period. Clarity is the winning
+    grid's mean onset strength relative to the whole envelope (about 1-2 for noise).
+    """
+    n = len(envelope)
+    smooth = np.convolve(envelope, [0.25, 0.5, 1.0, 0.5, 0.25], mode="same")
+    periods = period * np.linspace(1 - spread, 1 + spread, steps)
+    grid = (np.arange(int(np.ceil(periods[-1])))[None, :, None]
+            + periods[:, None, None] * np.arange(int(n / periods[0]) + 1)[None, None, :])
+    index = np.round(grid).astype(np.int32)
+    valid = index < n
+    scores = np.where(valid, smooth[np.minimum(index, n - 1)], 0).sum(axis=2) / np.maximum(1, valid.sum(axis=2))
+    best = np.unravel_index(int(np.argmax(scores)), scores.shape)
+    clarity = float(scores[best] / smooth.mean()) if smooth.mean() > 0 else 0.0
+    beats = index[best][valid[best]]
+    radius = max(1, int(period * 0.1))
+    windows = np.clip(beats[:, None] + np.arange(-radius, radius + 1)[None, :], 0, n - 1)
+    strength = envelope[windows]
+    refined = windows[np.arange(len(beats)), np.argmax(strength, axis=1)]
+    return np.unique(np.where(strength.max(axis=1) > 0, refined, beats)), clarity
+
+def analyze_beats(path, sample_rate=BEAT_SAMPLE_RATE, frame=BEAT_FRAME, hop=BEAT_HOP):
+    """{"tempo": bpm, "beats": [seconds], "duration": seconds} for an audio file.
+
+    Without a steady pulse (or for very short tracks) "beats" is empty and tempo is None.
+    """
+    with trace_span("beats", file=os.path.basename(path)):
+        samples = decode_audio_mono(path, sample_rate)
+        envelope = onset_envelope(samples, sample_rate, frame, hop)
+        frames_per_sec = sample_rate / hop
+        period = estimate_beat_period(envelope, frames_per_sec)
+        beats, clarity = track_beats(envelope, period) if period else (None, 0.0)
+        if clarity < BEAT_MIN_CLARITY:
+            return {"tempo": None, "beats": [], "duration": len(samples) / sample_rate}
+        # Envelope value i is the change into frame i + 1. A transient enters from the window's
+        # right edge and the flux peaks on the steep part of the Hann window, 3/4 into the frame.
+        times = ((beats + 1) * hop + 0.75 * frame) / sample_rate
+        tempo = 60 * (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 else 60 * frames_per_sec / period
+        return {"tempo": round(float(tempo), 2), "beats": [round(float(t), 4) for t in times],
+                "duration": len(samples) / sample_rate}
+
+def get_beat_grid(path):
+    """analyze_beats(path) through the index, so each track (by content hash) is analyzed once."""
+    store = get_store()
+    digest = file_digest(path)
+    grid = store.get_beat_grid(digest, BEAT_ANALYSIS_VERSION)
+    if grid is None:
+        grid = analyze_beats(path)
+        store.put_beat_grid(digest, BEAT_ANALYSIS_VERSION, grid)
+    else:
+        trace_count("beat_cache_hits")
+    return grid
+
+def beat_times(grid, duration, loop=AUDIO_LOOP_SHORT_TRACKS):
+    """Beat times (array) covering `duration`, repeating the grid where AudioCache loops the track."""
+    beats = np.asarray(grid["beats"], dtype=np.float64)
+    if not len(beats) or not loop or grid["duration"] <= 0 or grid["duration"] >= duration:
+        return beats[beats <= duration]
+    repeats = int(np.ceil(duration / grid["duration"]))
+    beats = (beats[None, :] + grid["duration"] * np.arange(repeats)[:, None]).ravel()
+    return beats[beats <= duration]
+
+def snap_to_beat(beats, start, duration, min_duration=BEAT_MIN_CLIP, max_duration=None):
+    """Length of a clip starting at `start` that ends on the beat nearest start + duration.
+
+    The clip stays between min_duration and max_duration long; without a beat in that
+    range, duration is kept.
+    """
+    candidates = beats[beats >= start + min_duration] if beats is not None else ()
+    if max_duration is not None and len(candidates):
+        candidates = candidates[candidates <= start + max_duration + 1e-9]
+    if not len(candidates):
+        return duration
+    end = candidates[np.argmin(np.abs(candidates - (start + duration)))]
+    return float(end - start)
+
+# --- Helper Functions (MoviePy part) ---
+def create_tiktok_video_threaded(image_files_list, output_filename, target_duration, resolution,
+                                 transition_style, transition_duration, overlay_text, filter_option, bg_music_path,
+                                 preview=False, **render_options):
+    """Runs the video creation (or, with preview=True, render_preview) in a separate thread
+    with viral options. Previews ignore `resolution`."""
+    global video_thread
     try:
-        results_count = 0
-        with DDGS() as ddgs:
-            ddgs_gen = ddgs.images(keywords, region="wt-wt", safesearch="moderate", max_results=MAX_THUMBNAILS_DISPLAY+10)
-            if not ddgs_gen:
-                status_queue.put("No results found or error fetching.")
-                image_queue.put("SEARCH_COMPLETE")
-                return
-            for result in ddgs_gen:
-                if results_count >= MAX_THUMBNAILS_DISPLAY:
-                    break
-                thumb_url = result.get('thumbnail')
-                full_url = result.get('image')
-                if not thumb_url or not full_url:
+        if preview:
+            render_preview(image_files_list, target_duration, transition_style, transition_duration, overlay_text,
+                           filter_option, bg_music_path, output_filename=output_filename, **render_options)
+        else:
+            render_video(image_files_list, output_filename, target_duration, resolution,
+                         transition_style, transition_duration, overlay_text, filter_option, bg_music_path,
+                         **render_options)
+    finally:
+        video_thread = None
+
+def render_video(image_files_list, output_filename, target_duration, resolution,
+                 transition_style, transition_duration, overlay_text, filter_option, bg_music_path,
+                 status=None, logger='bar', segment_workers=SEGMENT_WORKERS, incremental=INCREMENTAL_RENDER,
+                 fps=VIDEO_FPS, preset=None, trace=False, profile=DEFAULT_PROFILE, concurrent=1, beat_sync=False,
+                 cache_dir=None):
+    """Renders one video. Used by the GUI thread and by headless batch jobs.
+
+    Progress messages go to `status` (post_status by default). Frames are streamed
+    straight into the encoder, so memory does not grow with the number of images. With
+    segment_workers > 1 the timeline is rendered in parallel segments and stitched with
+    ffmpeg; the frames are identical to the single-process path. With incremental=True,
+    segments are kept in SEGMENT_CACHE_FOLDER and only changed ones are re-encoded.
+    With trace=True, per-stage timings are written to <output>.trace.json (Chrome trace
+    format) and summarized through `status`. Encoder settings come from the output
+    `profile`, tuned for `concurrent` renders sharing the host (see tune_encoder). The
+    video is written under a unique temporary name and renamed into place when complete.
+    With beat_sync=True and background music, clip cuts are snapped to the track's beats.
+    With cache_dir, the audio and segment caches live under it instead of DOWNLOAD_FOLDER.
+    Returns True on success.
+    """
+    status = status or post_status
+    trace_path = os.path.splitext(output_filename)[0] + ".trace.json" if trace else None
+    with tracing(trace_path, status), trace_span("render", output=os.path.basename(output_filename)):
+        status(f"Starting video creation with {len(image_files_list)} images...")
+        try:
+            valid_image_files = [f for f in image_files_list if os.path.exists(f)]
+            if len(valid_image_files) != len(image_files_list):
+                status(f"Warning: {len(image_files_list) - len(valid_image_files)} selected files not found. Proceeding with {len(valid_image_files)}.")
+            if not valid_image_files:
+                status("Error: No valid image files found to create video.")
+                return False
+
+            music = bg_music_path if bg_music_path and os.path.exists(bg_music_path) else None
+            beats = None
+            if beat_sync and music:
+                grid = get_beat_grid(music)
+                # Beats up to the longest the timeline could get (every clip at least 1 s)
+                beats = beat_times(grid, max(target_duration, len(valid_image_files)) + 10)
+                if len(beats):
+                    status(f"Beat sync: {grid['tempo']:.0f} BPM, {len(grid['beats'])} beats in the track")
+                else:
+                    status("Beat sync: no steady beat found in the music, using even clip lengths.")
+                    beats = None
+            with trace_span("timeline", images=len(valid_image_files)):
+                timeline = build_timeline(valid_image_files, target_duration, resolution, transition_style,
+                                          transition_duration, filter_option, overlay_text, status, beats)
+            if not timeline.entries:
+                status("Error: No clips were successfully created.")
+                return False
+
+            workers = max(1, segment_workers or 1)
+            encoder = tune_encoder(profile, concurrent * workers, preset)
+            status(f"Encoder: {profile} profile, preset {encoder['preset']}, crf {encoder['crf']}, "
+                   f"{encoder['threads']} threads per encode")
+            # Add background music if a valid file is provided
+            audio_path = None
+            if music:
+                audio_cache = AudioCache(os.path.join(cache_dir, "audio")) if cache_dir else AudioCache()
+                audio_path = audio_cache.prepare(music, timeline.duration, timeline.fade, encoder["audio_bitrate"])
+            base, ext = os.path.splitext(output_filename)
+            # Unique per render, so concurrent jobs never share temp files
+            partial_path = f"{base}.{uuid.uuid4().hex[:8]}.partial{ext}"
+            try:
+                if incremental or workers > 1:
+                    render_segments(timeline, partial_path, workers, status, audio_path, fps=fps, encoder=encoder,
+                                    cache=(SegmentCache(os.path.join(cache_dir, "segments")) if cache_dir else SegmentCache())
+                                    if incremental else None)
+                else:
+                    status(f"Writing video file: {output_filename}...")
+                    write_timeline(timeline, partial_path, fps, audio_path, encoder, logger=logger)
+                os.replace(partial_path, output_filename)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+
+            status(f"Success! Video saved as {output_filename}")
+            return True
+        except Exception as e:
+            status(f"FATAL VIDEO ERROR: {e}")
+            return False
+
+def preview_resolution(scale=PREVIEW_SCALE, resolution=VIDEO_RESOLUTION):
+    """resolution scaled down, rounded to even sizes as yuv420p requires."""
+    return tuple(max(2, int(round(side * scale / 2)) * 2) for side in resolution)
+
+def render_preview(image_files_list, target_duration, transition_style, transition_duration, overlay_text,
+                   filter_option, bg_music_path, output_filename=PREVIEW_VIDEO_FILENAME, scale=PREVIEW_SCALE,
+                   fps=PREVIEW_FPS, **render_options):
+    """Fast low-resolution render for checking pacing and transitions.
+
+    Uses the same timeline as render_video, so every clip, crossfade and fade lands at the
+    same timestamp as in the full render; only resolution, frame rate and preset differ.
+    """
+    render_options.setdefault("profile", "draft")
+    return render_video(image_files_list, output_filename, target_duration, preview_resolution(scale),
+                        transition_style, transition_duration, overlay_text, filter_option, bg_music_path,
+                        fps=fps, preset=PREVIEW_PRESET, **render_options)
+
+# --- Image Cache ---
+def file_digest(path):
+    """SHA-256 of a file's contents, memoized by (path, size, mtime)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    digest = _file_digests.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = _file_digests[key] = sha.hexdigest()
+    return digest
+
+def _extension_for(content_type):
+    """Maps an image content type to the file extension we store it under."""
+    mime_type = (content_type or "").split(';')[0].strip().lower()
+    return {'image/png': ".png", 'image/gif': ".gif", 'image/webp': ".webp"}.get(mime_type, ".jpg")
+
+class ImageCache:
+    """Content-addressed on-disk cache for thumbnails and full images.
+
+    Files are stored once per content hash (`<sha256><ext>`); URLs map onto hashes, so the
+    same picture served from several URLs is kept once. A JSON index next to the files
+    tracks size and last use, so lookups never scan the directory. Eviction drops entries
+    older than max_age and then least recently used ones until the cache fits max_bytes;
+    puts only run it when the total goes over max_bytes (evicting down to 90%, so the next
+    puts don't evict again) or every CACHE_SWEEP_SEC. The index is written when
+    CACHE_FLUSH_CHANGES files were added or removed or CACHE_FLUSH_SEC passed, and by flush()
+    at exit.
+    Pinned files (currently selected images) are never evicted.
+    """
+
+    INDEX_NAME = "index.json"
+
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE_SEC):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.pinned = set()
+        self.dirty = False
+        self.changes = 0
+        self.last_flush = self.last_sweep = time.time()
+        os.makedirs(folder, exist_ok=True)
+        self.index_path = os.path.join(folder, self.INDEX_NAME)
+        self.urls, self.files = self._load_index()
+        self.digest_urls = {}
+        for url, digest in self.urls.items():
+            self.digest_urls.setdefault(digest, set()).add(url)
+        self.total = sum(entry["size"] for entry in self.files.values())
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def _read_index(self):
+        """(urls, files) as last written to disk, empty if missing or unreadable."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("urls", {}), data.get("files", {})
+        except (OSError, ValueError):
+            return {}, {}
+
+    def _load_index(self):
+        """Reads the index and reconciles it with the folder once: entries whose file is gone
+        are dropped, and `<sha256>.<ext>` files it doesn't list (written by another process,
+        or by one that died before its deferred flush) are adopted, so eviction counts them.
+        Temp files left by interrupted writes are removed once they are an hour old."""
+        urls, files = self._read_index()
+        on_disk = {}
+        now = time.time()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            digest, _, extension = name.partition(".")
+            if name.startswith(".") and name.endswith(".tmp"):
+                with contextlib.suppress(OSError):
+                    if now - os.path.getmtime(path) > 3600:
+                        os.remove(path)
+            elif len(digest) == 64 and extension and all(c in "0123456789abcdef" for c in digest):
+                on_disk[name] = digest
+        files = {digest: entry for digest, entry in files.items() if entry["file"] in on_disk}
+        for name, digest in on_disk.items():
+            if digest not in files:
+                with contextlib.suppress(OSError):
+                    stat = os.stat(os.path.join(self.folder, name))
+                    files[digest] = {"file": name, "size": stat.st_size, "atime": stat.st_mtime}
+                    self.dirty = True
+        urls = {url: digest for url, digest in urls.items() if digest in files}
+        return urls, files
+
+    def _merge_index(self, urls, files):
+        """Takes in entries another process wrote to the index since we loaded it (call with
+        the lock held), so a flush doesn't drop them and leave their files untracked."""
+        for digest, entry in files.items():
+            mine = self.files.get(digest)
+            if mine is not None:
+                mine["atime"] = max(mine["atime"], entry["atime"])
+            elif os.path.exists(os.path.join(self.folder, entry["file"])):
+                self.files[digest] = dict(entry)
+                self.total += entry["size"]
+        for url, digest in urls.items():
+            if url not in self.urls and digest in self.files:
+                self.urls[url] = digest
+                self.digest_urls.setdefault(digest, set()).add(url)
+
+    def flush(self):
+        """Writes the index atomically if it changed, merged with what other processes wrote
+        to it meanwhile (evicting if that goes over max_bytes). Reads and serializes outside the lock, so lookups and puts are not
+        held up while the file is read and written."""
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+            urls, files = self._read_index()
+            with self.lock:
+                self._merge_index(urls, files)
+                if self.total > self.max_bytes:
+                    self.evict()
+                snapshot = {"urls": dict(self.urls), "files": {digest: dict(entry) for digest, entry in self.files.items()}}
+                self.dirty = False
+                self.changes = 0
+                self.last_flush = time.time()
+            tmp_path = os.path.join(self.folder, f".{self.INDEX_NAME}.{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(snapshot))   # One C-encoder call; json.dump encodes in Python chunks
+            os.replace(tmp_path, self.index_path)
+
+    def _touch(self, added_or_removed=True):
+        """Records an index change (call with the lock held). True when a flush is due; the
+        caller then owns that flush, so concurrent puts don't all queue up to write the index.
+        Last-use updates only count towards the time limit."""
+        self.dirty = True
+        self.changes += added_or_removed
+        if self.changes < CACHE_FLUSH_CHANGES and time.time() - self.last_flush < CACHE_FLUSH_SEC:
+            return False
+        self.changes = 0
+        self.last_flush = time.time()
+        return True
+
+    def path_for(self, digest):
+        return os.path.join(self.folder, self.files[digest]["file"])
+
+    def get(self, url):
+        """Returns the cached file path for url (marking it recently used), or None."""
+        with self.lock:
+            digest = self.urls.get(url)
+            if digest is None:
+                return None
+            path = self.path_for(digest)
+            if not os.path.exists(path):
+                self._forget(digest)
+                return None
+            self.files[digest]["atime"] = time.time()
+            flush_due = self._touch(False)
+        if flush_due:
+            self.flush()
+        return path
+
+    def get_bytes(self, url):
+        path = self.get(url)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, url, data, extension=".jpg"):
+        """Stores data for url and returns its path. Identical content is stored only once."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            stored = digest in self.files and os.path.exists(self.path_for(digest))
+        if not stored:
+            # Written outside the lock; a concurrent put of the same content writes the same bytes
+            filename = digest + extension
+            tmp_path = os.path.join(self.folder, f".{filename}.{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.folder, filename))
+        with self.lock:
+            entry = self.files.get(digest)
+            if entry is None:
+                self.files[digest] = {"file": digest + extension, "size": len(data), "atime": time.time()}
+                self.total += len(data)
+            else:
+                entry["atime"] = time.time()
+            previous = self.urls.get(url)
+            if previous != digest:
+                if previous is not None:
+                    self.digest_urls[previous].discard(url)
+                self.urls[url] = digest
+                self.digest_urls.setdefault(digest, set()).add(url)
+            flush_due = self._touch(entry is None or previous != digest)
+            path = self.path_for(digest)
+            now = time.time()
+            if self.total > self.max_bytes or now - self.last_sweep >= CACHE_SWEEP_SEC:
+                self.last_sweep = now
+                self.evict(keep=[path])
+        if flush_due:
+            self.flush()
+        return path
+
+    def pin(self, path):
+        with self.lock:
+            self.pinned.add(os.path.abspath(path))
+
+    def unpin(self, path):
+        with self.lock:
+            self.pinned.discard(os.path.abspath(path))
+
+    def _forget(self, digest):
+        entry = self.files.pop(digest, None)
+        for url in self.digest_urls.pop(digest, ()):
+            del self.urls[url]
+        if entry is not None:
+            self.total -= entry["size"]
+        self._touch()
+        return entry
+
+    def evict(self, keep=()):
+        """Applies the age limit, then LRU eviction down to max_bytes (to 90% of it when it was
+        over, so the puts that follow don't evict again). Returns bytes freed."""
+        with self.lock:
+            now = time.time()
+            target = self.max_bytes * 0.9 if self.total > self.max_bytes else self.max_bytes
+            keep = {os.path.abspath(path) for path in keep} | self.pinned
+            lru = sorted(self.files.items(), key=lambda item: item[1]["atime"])
+            freed = 0
+            for digest, entry in lru:
+                if self.total <= target and now - entry["atime"] <= self.max_age:
+                    continue
+                path = self.path_for(digest)
+                if os.path.abspath(path) in keep:
                     continue
                 try:
-                    response = requests.get(thumb_url, timeout=10)
-                    response.raise_for_status()
-                    content_type = response.headers.get('content-type')
-                    if content_type and content_type.startswith('image'):
-                        image_data = response.content
-                        image_queue.put((image_data, full_url, thumb_url))
-                        results_count += 1
-                    else:
-                        log_message(f"Skipping non-image thumbnail: {thumb_url}")
-                except Exception as e:
-                    log_message(f"Failed to download thumbnail {thumb_url}: {e}")
-            status_queue.put(f"Found {results_count} potential thumbnails (DuckDuckGo).")
-            image_queue.put("SEARCH_COMPLETE")
-    except Exception as e:
-        status_queue.put(f"Error during DuckDuckGo search: {e}")
-        image_queue.put("SEARCH_COMPLETE")
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                self._forget(digest)
+                freed += entry["size"]
+            return freed
 
-def fetch_images_bing(keywords):
-    status_queue.put(f"Searching Bing for '{keywords}'...")
-    results_count = 0
-    global BING_API_KEY
-    if not BING_API_KEY:
-        status_queue.put("Error: Bing API key not provided.")
-        image_queue.put("SEARCH_COMPLETE")
-        return
+def get_image_cache():
+    """Returns the shared image cache, creating it (and its folder) on first use."""
+    global _image_cache
+    with _http_session_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+            atexit.register(_image_cache.flush)
+        return _image_cache
+
+# --- Thumbnail Fetch Layer (shared by all engines) ---
+def get_http_session():
+    """Returns the shared keep-alive session used for every search/thumbnail request."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(total=FETCH_RETRIES, backoff_factor=FETCH_BACKOFF,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(["GET", "HEAD"]), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+def get_fetch_pool():
+    """Returns the bounded worker pool used for thumbnail downloads."""
+    global _fetch_pool
+    with _http_session_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="thumb")
+        return _fetch_pool
+
+def _host_slot(url):
+    """Per-host semaphore so one host never gets more than FETCH_PER_HOST requests at once."""
+    host = urlsplit(url).netloc
+    with _http_session_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(FETCH_PER_HOST)
+        return slot
+
+def fetch_thumbnail(thumb_url, cancelled=None):
+    """Returns thumbnail bytes from the image cache, or downloads them through the shared session.
+
+    The body is streamed in chunks; once the `cancelled` event is set the download is
+    abandoned (and its connection dropped) at the next chunk. Returns None on failure
+    or cancellation.
+    """
     try:
-        headers = {"Ocp-Apim-Subscription-Key": BING_API_KEY}
-        params = {"q": keywords, "count": MAX_THUMBNAILS_DISPLAY + 10}
-        response = requests.get("https://api.bing.microsoft.com/v7.0/images/search", headers=headers, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        images = data.get("value", [])
-        for item in images:
-            if results_count >= MAX_THUMBNAILS_DISPLAY:
-                break
-            thumb_url = item.get("thumbnailUrl")
-            full_url = item.get("contentUrl")
-            if not thumb_url or not full_url:
-                continue
+        cache = get_image_cache()
+        image_data = cache.get_bytes(thumb_url)
+        if image_data is not None:
+            return image_data
+        with _host_slot(thumb_url):
+            if cancelled is not None and cancelled.is_set():
+                return None
+            response = get_http_session().get(thumb_url, timeout=FETCH_TIMEOUT, stream=True)
             try:
-                r_thumb = requests.get(thumb_url, timeout=10)
-                r_thumb.raise_for_status()
-                content_type = r_thumb.headers.get('content-type')
-                if content_type and content_type.startswith('image'):
-                    image_data = r_thumb.content
-                    image_queue.put((image_data, full_url, thumb_url))
-                    results_count += 1
-                else:
+                response.raise_for_status()
+                content_type = response.headers.get('content-type')
+                if not (content_type and content_type.startswith('image')):
                     log_message(f"Skipping non-image thumbnail: {thumb_url}")
-            except Exception as e:
-                log_message(f"Failed to download thumbnail {thumb_url}: {e}")
-        status_queue.put(f"Found {results_count} potential thumbnails (Bing).")
+                    return None
+                chunks = []
+                for chunk in response.iter_content(16384):
+                    if cancelled is not None and cancelled.is_set():
+                        return None
+                    chunks.append(chunk)
+            finally:
+                response.close()
+        image_data = b"".join(chunks)
+        cache.put(thumb_url, image_data, _extension_for(content_type))
+        return image_data
     except Exception as e:
-        status_queue.put(f"Error during Bing search: {e}")
-    finally:
-        image_queue.put("SEARCH_COMPLETE")
+        log_message(f"Failed to download thumbnail {thumb_url}: {e}", logging.WARNING)
+    return None
 
-def fetch_images_brave(keywords):
-    status_queue.put(f"Searching Brave for '{keywords}'...")
-    results_count = 0
+def decode_thumbnail(image_data):
+    """Decodes and shrinks thumbnail bytes to THUMBNAIL_SIZE (PIL image, off the Tk thread)."""
+    img = Image.open(io.BytesIO(image_data))
+    img.draft("RGB", THUMBNAIL_SIZE)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+    img.thumbnail(THUMBNAIL_SIZE)
+    return img
+
+def fetch_and_decode_thumbnail(thumb_url, cancelled=None):
+    """Worker task: download (or cache hit) plus decode. Returns a PIL thumbnail or None."""
+    if cancelled is not None and cancelled.is_set():
+        return None
+    image_data = fetch_thumbnail(thumb_url, cancelled)
+    if image_data is None:
+        return None
+    try:
+        return decode_thumbnail(image_data)
+    except Exception as e:
+        log_message(f"Error processing thumbnail for {thumb_url}: {e}", logging.WARNING)
+        return None
+
+def fetch_thumbnails(candidates, limit=MAX_THUMBNAILS_DISPLAY, out_queue=None, search=None, leftovers=None):
+    """Downloads and decodes (thumb_url, full_url) candidates concurrently.
+
+    (generation, thumbnail image, full_url, thumb_url) tuples are put on out_queue
+    (image_queue by default) in completion order, so a slow host never holds up the rest
+    of the grid. With a SearchSession, its deduper skips duplicate URLs before download and
+    drops look-alike thumbnails (it may be shared by several concurrent calls), and
+    cancelling the session abandons the remaining downloads. Stops once `limit` thumbnails
+    were delivered (or the deduper is full); candidates not used by then are appended to
+    `leftovers` so a later page can show them. Returns the number delivered.
+    """
+    generation, cancelled = (search.generation, search.cancelled) if search is not None else (0, None)
+    dedupe = search.dedupe if search is not None else None
+    if dedupe is not None:
+        candidates = dedupe.new_candidates(candidates)
+    out_queue = image_queue if out_queue is None else out_queue
+    pool = get_fetch_pool()
+    futures = {pool.submit(fetch_and_decode_thumbnail, thumb_url, cancelled): (thumb_url, full_url)
+               for thumb_url, full_url in candidates}
+    delivered = 0
+    used = set()
     try:
-        params = {"q": keywords, "offset": 0, "count": MAX_THUMBNAILS_DISPLAY + 10}
-        response = requests.get("https://api.search.brave.com/images", params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        images = data.get("images", [])
-        for item in images:
-            if results_count >= MAX_THUMBNAILS_DISPLAY:
+        for future in as_completed(futures):
+            if cancelled is not None and cancelled.is_set():
                 break
-            thumb_url = item.get("thumbnail") or item.get("thumbnailUrl")
-            full_url = item.get("url") or item.get("contentUrl")
-            if not thumb_url or not full_url:
+            thumb_image = future.result()
+            if thumb_image is not None and dedupe is not None and not dedupe.accept(thumb_image):
+                if dedupe.full:
+                    break   # Undecided: this look-alike check may pass against the next page's hashes
+                thumb_image = None
+            used.add(future)
+            if dedupe is not None:
+                dedupe.see(futures[future])
+            if thumb_image is None:
                 continue
+            thumb_url, full_url = futures[future]
+            out_queue.put((generation, thumb_image, full_url, thumb_url))
+            delivered += 1
+            if delivered >= limit:
+                break
+    finally:
+        for pending in futures:
+            pending.cancel()
+        unused = [candidate for future, candidate in futures.items() if future not in used]
+        if dedupe is not None:
+            dedupe.release(unused)
+        if leftovers is not None:
+            leftovers.extend(unused)
+    return delivered
+
+# --- Full Images (download-time downscaling and speculative prefetch) ---
+def shrink_full_image(data, extension, resolution=VIDEO_RESOLUTION):
+    """Downscales a downloaded image so it just covers resolution, re-encoded as JPEG.
+
+    JPEGs are decoded at the smallest DCT scale that still covers the target, so a 4000px
+    original is never decoded at full size. Animated images are kept as they are. Raises
+    if the data is not a decodable image. Returns (data, extension).
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        if getattr(img, "is_animated", False):
+            img.verify()
+            return data, extension
+        src_w, src_h = img.size
+        cover = min(1.0, max(resolution[0] / src_w, resolution[1] / src_h))
+        size = (max(1, int(src_w * cover + 0.999)), max(1, int(src_h * cover + 0.999)))
+        if cover == 1.0 and extension == ".jpg":
+            img.verify()
+            return data, extension
+        img.draft("RGB", size)
+        img = flatten_rgb(img)
+        if img.size != size:
+            img = img.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=FULL_IMAGE_QUALITY)
+        return buffer.getvalue(), ".jpg"
+
+def fetch_full_image(url, throttle=None):
+    """Downloads a full image into the image cache, shrunk by shrink_full_image(). Returns its path.
+
+    `throttle(nbytes)` is called per received chunk and may sleep to enforce a bandwidth budget.
+    """
+    with _host_slot(url):
+        response = get_http_session().get(url, stream=True, timeout=FETCH_TIMEOUT)
+        try:
+            response.raise_for_status()
+            content_type = response.headers.get('content-type')
+            if not content_type or not content_type.startswith('image'):
+                raise ValueError(f"Non-image content type: {content_type}")
+            if int(response.headers.get('content-length') or 0) > FULL_IMAGE_MAX_BYTES:
+                raise ValueError("Image too large")
+            buffer = io.BytesIO()
+            for chunk in response.iter_content(65536):
+                if throttle is not None:
+                    throttle(len(chunk))
+                buffer.write(chunk)
+                if buffer.tell() > FULL_IMAGE_MAX_BYTES:
+                    raise ValueError("Image too large")
+        finally:
+            response.close()
+    data, extension = shrink_full_image(buffer.getvalue(), _extension_for(content_type))
+    return get_image_cache().put(url, data, extension)
+
+class FullImagePrefetcher:
+    """Speculatively downloads full images for results the user is looking at.
+
+    want() replaces the queue with the currently visible results and hover() moves one to
+    the front. A few low-priority workers share a bandwidth budget, so prefetching never
+    competes with thumbnails for the whole link. Downloads go through fetch_full_image(),
+    so selecting a prefetched result is a cache hit; selecting one that is still
+    downloading waits for it and lifts its throttle.
+    """
+
+    def __init__(self, workers=PREFETCH_WORKERS, bytes_per_sec=PREFETCH_BYTES_PER_SEC):
+        self.bytes_per_sec = bytes_per_sec
+        self.cond = threading.Condition()
+        self.pending = OrderedDict()  # {url: None}, next download first
+        self.inflight = {}            # {url: {'done': Event, 'urgent': bool}}
+        self.failed = set()
+        self.wanted = ()
+        self.next_free = 0.0          # Monotonic time the budget is spent until
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"prefetch-{i}", daemon=True).start()
+
+    def want(self, urls):
+        """Queues urls for prefetching, dropping queued ones that are no longer wanted."""
+        urls = tuple(urls)
+        with self.cond:
+            if urls == self.wanted:
+                return
+            self.wanted = urls
+            self.pending = OrderedDict((url, None) for url in urls
+                                       if url not in self.inflight and url not in self.failed)
+            self.cond.notify_all()
+
+    def hover(self, url):
+        with self.cond:
+            if url in self.inflight or url in self.failed:
+                return
+            self.pending[url] = None
+            self.pending.move_to_end(url, last=False)
+            self.cond.notify()
+
+    def wait(self, url, timeout=None):
+        """Blocks until a prefetch of url in progress has finished; it runs unthrottled from now on."""
+        with self.cond:
+            self.pending.pop(url, None)
+            job = self.inflight.get(url)
+            if job is None:
+                return
+            job['urgent'] = True
+        job['done'].wait(timeout)
+
+    def _throttle(self, job, nbytes):
+        if job['urgent']:
+            return
+        with self.cond:
+            now = time.monotonic()
+            self.next_free = max(self.next_free, now - 1.0) + nbytes / self.bytes_per_sec
+            delay = self.next_free - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _run(self):
+        cache = get_image_cache()
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                url, _ = self.pending.popitem(last=False)
+                job = self.inflight[url] = {'done': threading.Event(), 'urgent': False}
             try:
-                r_thumb = requests.get(thumb_url, timeout=10)
-                r_thumb.raise_for_status()
-                content_type = r_thumb.headers.get('content-type')
-                if content_type and content_type.startswith('image'):
-                    image_data = r_thumb.content
-                    image_queue.put((image_data, full_url, thumb_url))
-                    results_count += 1
-                else:
-                    log_message(f"Skipping non-image thumbnail: {thumb_url}")
-            except Exception as e:
-                log_message(f"Failed to download thumbnail {thumb_url}: {e}")
-        status_queue.put(f"Found {results_count} potential thumbnails (Brave).")
-    except Exception as e:
-        status_queue.put(f"Error during Brave search: {e}")
+                if cache.get(url) is None:
+                    fetch_full_image(url, throttle=lambda nbytes: self._throttle(job, nbytes))
+            except Exception:
+                with self.cond:
+                    self.failed.add(url)  # The selection download will report the error
+            finally:
+                with self.cond:
+                    del self.inflight[url]
+                job['done'].set()
+
+def get_prefetcher():
+    """Returns the shared full-image prefetcher, starting its workers on first use."""
+    global _prefetcher
+    with _http_session_lock:
+        if _prefetcher is None:
+            _prefetcher = FullImagePrefetcher()
+        return _prefetcher
+
+# --- Search, Asset and Project Index (SQLite) ---
+def normalize_keywords(keywords):
+    return " ".join(keywords.lower().split())
+
+class ProjectStore:
+    """Local SQLite index shared by the GUI and headless runs.
+
+    Holds engine results per (engine, keywords, page) with a TTL, the full images that were
+    selected (content hash, dimensions, format and cached path, by URL), named projects (an
+    ordered list of image URLs plus the render options, in the same keys as a batch job) and
+    the beat grids of background tracks, by content hash.
+    One connection per process, serialized with a lock.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS search_results (
+            engine TEXT NOT NULL, keywords TEXT NOT NULL, page_offset INTEGER NOT NULL, count INTEGER NOT NULL,
+            results TEXT NOT NULL, fetched REAL NOT NULL,
+            PRIMARY KEY (engine, keywords, page_offset, count));
+        CREATE INDEX IF NOT EXISTS search_results_fetched ON search_results (fetched);
+        CREATE TABLE IF NOT EXISTS assets (
+            url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, path TEXT NOT NULL, width INTEGER, height INTEGER,
+            format TEXT, bytes INTEGER, added REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS assets_sha256 ON assets (sha256);
+        CREATE TABLE IF NOT EXISTS projects (name TEXT PRIMARY KEY, options TEXT NOT NULL, updated REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS project_assets (
+            project TEXT NOT NULL REFERENCES projects (name) ON DELETE CASCADE, position INTEGER NOT NULL,
+            url TEXT NOT NULL, PRIMARY KEY (project, position));
+        CREATE INDEX IF NOT EXISTS project_assets_url ON project_assets (url);
+        CREATE TABLE IF NOT EXISTS beat_grids (
+            sha256 TEXT NOT NULL, version INTEGER NOT NULL, grid TEXT NOT NULL, analyzed REAL NOT NULL,
+            PRIMARY KEY (sha256, version));
+    """
+
+    def __init__(self, path=INDEX_DB_PATH, ttl=SEARCH_RESULT_TTL_SEC):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self.lock, self.db:
+            if path != ":memory:":
+                self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA foreign_keys=ON")
+            self.db.executescript(self.SCHEMA)
+            self.db.execute("DELETE FROM search_results WHERE fetched < ?", (time.time() - ttl,))
+
+    def get_search(self, engine, keywords, offset, count):
+        """Cached [(thumb_url, full_url)] for this page, or None when missing or expired."""
+        with self.lock:
+            row = self.db.execute("SELECT results FROM search_results WHERE engine = ? AND keywords = ? "
+                                  "AND page_offset = ? AND count = ? AND fetched >= ?",
+                                  (engine, normalize_keywords(keywords), offset, count,
+                                   time.time() - self.ttl)).fetchone()
+        return [tuple(pair) for pair in json.loads(row[0])] if row else None
+
+    def put_search(self, engine, keywords, offset, count, results):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?, ?)",
+                            (engine, normalize_keywords(keywords), offset, count, json.dumps(results), time.time()))
+
+    def record_asset(self, url, path):
+        """Indexes a downloaded full image under its URL."""
+        path = os.path.abspath(path)
+        with Image.open(path) as img:
+            width, height, fmt = img.width, img.height, img.format
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (url, file_digest(path), path, width, height, fmt, os.path.getsize(path), time.time()))
+
+    def asset_paths(self, urls):
+        """Indexed paths for urls, in the same order; URLs without an asset are left out."""
+        urls = list(urls)
+        with self.lock:
+            paths = {}
+            for first in range(0, len(urls), 500):   # Stay under SQLite's bound parameter limit
+                chunk = urls[first:first + 500]
+                paths.update(self.db.execute(f"SELECT url, path FROM assets WHERE url IN ({','.join('?' * len(chunk))})",
+                                             chunk))
+        return [paths[url] for url in urls if url in paths]
+
+    def asset(self, url):
+        """The asset row for url as a dict, or None."""
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM assets WHERE url = ?", (url,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def save_project(self, name, urls, options):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?)", (name, json.dumps(options), time.time()))
+            self.db.execute("DELETE FROM project_assets WHERE project = ?", (name,))
+            self.db.executemany("INSERT INTO project_assets VALUES (?, ?, ?)",
+                                [(name, position, url) for position, url in enumerate(urls)])
+
+    def load_project(self, name):
+        """(urls in order, options) for a saved project, or None."""
+        with self.lock:
+            row = self.db.execute("SELECT options FROM projects WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            urls = [url for url, in self.db.execute("SELECT url FROM project_assets WHERE project = ? "
+                                                     "ORDER BY position", (name,))]
+        return urls, json.loads(row[0])
+
+    def get_beat_grid(self, sha256, version):
+        with self.lock:
+            row = self.db.execute("SELECT grid FROM beat_grids WHERE sha256 = ? AND version = ?",
+                                  (sha256, version)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_beat_grid(self, sha256, version, grid):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO beat_grids VALUES (?, ?, ?, ?)",
+                            (sha256, version, json.dumps(grid), time.time()))
+
+    def project_names(self):
+        with self.lock:
+            return [name for name, in self.db.execute("SELECT name FROM projects WHERE name != ? ORDER BY updated DESC",
+                                                      (AUTOSAVE_PROJECT,))]
+
+def get_store():
+    """Returns this process's index connection, opening it on first use."""
+    global _store
+    with _http_session_lock:
+        if _store is None or _store[0] != os.getpid():
+            _store = (os.getpid(), ProjectStore())
+        return _store[1]
+
+def cached_engine_search(engine, keywords, offset, count):
+    """SEARCH_ENGINES[engine](...) through the index: a page fetched within SEARCH_RESULT_TTL_SEC is reused."""
+    store = get_store()
+    candidates = store.get_search(engine, keywords, offset, count)
+    if candidates is None:
+        candidates = SEARCH_ENGINES[engine](keywords, offset, count)
+        if candidates:
+            store.put_search(engine, keywords, offset, count, candidates)
+    return candidates
+
+def ensure_asset(url):
+    """Local path of a selected image, downloading it again if the cached file is gone."""
+    store = get_store()
+    asset = store.asset(url)
+    if asset and os.path.exists(asset["path"]):
+        return asset["path"]
+    path = get_image_cache().get(url) or fetch_full_image(url)
+    store.record_asset(url, path)
+    return path
+
+# --- Result Deduplication ---
+def normalize_url(url):
+    """Canonical form of an image URL: http/https and "www." ignored, fragment dropped,
+    query parameters sorted, percent-encoding and trailing slashes normalized."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = unquote(parts.path).rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit(("", host, path, query, ""))
+
+def dhash(img, size=8):
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale copy of img."""
+    pixels = np.asarray(img.convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+class ResultDeduper:
+    """Drops search results we already have, first by normalized URL (before downloading)
+    and then by perceptual hash of the decoded thumbnail. Thread-safe, so engines searched
+    concurrently can share one instance.
+
+    A URL only counts as seen once its thumbnail was delivered or rejected (see()); while
+    it downloads it is claimed, and release() hands unused candidates back for a later page.
+    """
+
+    def __init__(self, limit=MAX_THUMBNAILS_DISPLAY, threshold=DHASH_THRESHOLD):
+        self.limit = limit
+        self.threshold = threshold
+        self.seen_urls = set()
+        self.claimed = set()
+        self.hashes = []
+        self.lock = threading.Lock()
+        self.url_duplicates = 0
+        self.image_duplicates = 0
+
+    @property
+    def full(self):
+        return len(self.hashes) >= self.limit
+
+    def next_page(self, limit=MAX_THUMBNAILS_DISPLAY):
+        """Allows `limit` more accepted thumbnails; seen URLs and hashes carry over."""
+        with self.lock:
+            self.limit = len(self.hashes) + limit
+
+    @staticmethod
+    def _keys(candidate):
+        thumb_url, full_url = candidate
+        return normalize_url(full_url), "thumb:" + normalize_url(thumb_url)
+
+    def new_candidates(self, candidates):
+        """Claims the (thumb_url, full_url) pairs whose thumbnail or full image URL was neither
+        seen nor claimed yet. Every claimed pair must later go to see() or release()."""
+        fresh = []
+        with self.lock:
+            for candidate in candidates:
+                keys = self._keys(candidate)
+                if any(key in self.seen_urls or key in self.claimed for key in keys):
+                    self.url_duplicates += 1
+                    continue
+                self.claimed.update(keys)
+                fresh.append(candidate)
+        return fresh
+
+    def see(self, candidate):
+        """Marks a claimed pair as done (delivered, rejected or failed to download)."""
+        keys = self._keys(candidate)
+        with self.lock:
+            self.claimed.difference_update(keys)
+            self.seen_urls.update(keys)
+
+    def release(self, candidates):
+        """Returns claimed pairs that were never used, so they can be offered again."""
+        with self.lock:
+            for candidate in candidates:
+                self.claimed.difference_update(self._keys(candidate))
+
+    def accept(self, thumb_image):
+        """True if the thumbnail is not a near-duplicate of one already accepted (and records it)."""
+        image_hash = dhash(thumb_image)
+        with self.lock:
+            if self.full:
+                return False
+            if any(bin(image_hash ^ other).count("1") <= self.threshold for other in self.hashes):
+                self.image_duplicates += 1
+                return False
+            self.hashes.append(image_hash)
+            return True
+
+# --- Multi-Engine Image Search Functions ---
+def search_duckduckgo(keywords, offset=0, count=MAX_THUMBNAILS_DISPLAY + 10):
+    """Returns [(thumb_url, full_url)] candidates from DuckDuckGo.
+
+    DDGS can't start at an offset: every call lists results from the top. The listing is
+    kept per keywords and at least doubled when a later page needs more, so paging costs
+    about twice the results shown instead of re-listing every earlier page each time.
+    """
+    key = normalize_keywords(keywords)
+    with _ddg_results_lock:
+        results, complete = _ddg_results.get(key, ([], False))
+    if len(results) < offset + count and not complete:
+        wanted = max(offset + count, 2 * len(results))
+        with DDGS() as ddgs:
+            listed = ddgs.images(keywords, region="wt-wt", safesearch="moderate", max_results=wanted) or []
+        results = [(result.get('thumbnail'), result.get('image')) for result in listed]
+        complete = len(results) < wanted
+        with _ddg_results_lock:
+            _ddg_results[key] = (results, complete)
+            _ddg_results.move_to_end(key)
+            while len(_ddg_results) > 16:
+                _ddg_results.popitem(last=False)
+    return results[offset:offset + count]
+
+def search_bing(keywords, offset=0, count=MAX_THUMBNAILS_DISPLAY + 10):
+    """Returns [(thumb_url, full_url)] candidates from the Bing Image Search API."""
+    if not BING_API_KEY:
+        raise RuntimeError("Bing API key not provided.")
+    headers = {"Ocp-Apim-Subscription-Key": BING_API_KEY}
+    params = {"q": keywords, "offset": offset, "count": count}
+    response = get_http_session().get(BING_ENDPOINT, headers=headers, params=params, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    return [(item.get("thumbnailUrl"), item.get("contentUrl")) for item in response.json().get("value", [])]
+
+def search_brave(keywords, offset=0, count=MAX_THUMBNAILS_DISPLAY + 10):
+    """Returns [(thumb_url, full_url)] candidates from Brave image search."""
+    params = {"q": keywords, "offset": offset, "count": count}
+    response = get_http_session().get(BRAVE_ENDPOINT, params=params, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    return [(item.get("thumbnail") or item.get("thumbnailUrl"), item.get("url") or item.get("contentUrl"))
+            for item in response.json().get("images", [])]
+
+SEARCH_ENGINES = {"DuckDuckGo": search_duckduckgo, "Bing": search_bing, "Brave": search_brave}
+ALL_ENGINES = "All engines"
+
+class SearchSession:
+    """One search as the grid sees it: a generation id that tags every queued result, a
+    cancel flag, and per-engine paging offsets. Results from superseded generations are
+    dropped by the consumer; cancel() makes their downloads stop early."""
+
+    def __init__(self, keywords, engines):
+        self.generation = next(_search_generations)
+        self.keywords = keywords
+        self.engines = list(engines)
+        self.cancelled = threading.Event()
+        self.dedupe = ResultDeduper()
+        self.offsets = {engine: 0 for engine in self.engines}
+        self.exhausted = set()     # Engines that listed fewer than a full page
+        self.backlog = {}          # engine -> candidates listed but not shown yet
+        self.pages = 0
+        self.loading = False
+
+    @property
+    def has_more(self):
+        return not self.cancelled.is_set() and (len(self.exhausted) < len(self.engines) or any(self.backlog.values()))
+
+    def cancel(self):
+        self.cancelled.set()
+
+def search_engine_thumbnails(engine, search):
+    """Queries one engine for the session's next page and streams its deduplicated
+    thumbnails onto image_queue, after the candidates left over from the previous page.
+    Returns the count."""
+    offset = search.offsets[engine]
+    candidates = search.backlog.pop(engine, [])
+    if engine not in search.exhausted:
+        page = cached_engine_search(engine, search.keywords, offset, SEARCH_PAGE_SIZE)
+        search.offsets[engine] = offset + len(page)
+        if len(page) < SEARCH_PAGE_SIZE:
+            search.exhausted.add(engine)
+        candidates += [(thumb_url, full_url) for thumb_url, full_url in page if thumb_url and full_url]
+    if search.cancelled.is_set():
+        return 0
+    if not candidates:
+        if offset == 0:
+            post_status(f"No results found or error fetching ({engine}).")
+        return 0
+    leftovers = []
+    delivered = fetch_thumbnails(candidates, search=search, leftovers=leftovers)
+    if leftovers and not search.cancelled.is_set():
+        search.backlog[engine] = leftovers
+    return delivered
+
+def fetch_images_page(search):
+    """Fetches the next page from every engine of the search that still has results,
+    concurrently, and merges them as they arrive. Returns the number delivered."""
+    search.loading = True
+    search.dedupe.next_page()
+    engines = [engine for engine in search.engines if engine not in search.exhausted or search.backlog.get(engine)]
+    results_count = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(engines)), thread_name_prefix="engine") as pool:
+            futures = {pool.submit(search_engine_thumbnails, engine, search): engine for engine in engines}
+            for future in as_completed(futures):
+                try:
+                    results_count += future.result()
+                except Exception as e:
+                    search.exhausted.add(futures[future])
+                    post_status(f"Error during {futures[future]} search: {e}", logging.ERROR)
     finally:
-        image_queue.put("SEARCH_COMPLETE")
+        search.pages += 1
+        search.loading = False
+        image_queue.put(("SEARCH_COMPLETE", search.generation))
+    if search.cancelled.is_set():
+        return results_count
+    label = "all engines" if len(search.engines) > 1 else search.engines[0]
+    page = f", page {search.pages}" if search.pages > 1 else ""
+    if len(search.engines) > 1:
+        post_status(f"Found {results_count} potential thumbnails from {label}{page} "
+                         f"({search.dedupe.url_duplicates} duplicate URLs, "
+                         f"{search.dedupe.image_duplicates} look-alike images skipped).")
+    else:
+        post_status(f"Found {results_count} potential thumbnails ({label}{page}).")
+    return results_count
 
-def fetch_images_thread(keywords):
-    """Dispatches image search based on selected engine."""
-    engine = search_engine_var.get()
-    if engine == "DuckDuckGo":
-        fetch_images_duckduckgo(keywords)
-    elif engine == "Bing":
-        fetch_images_bing(keywords)
-    elif engine == "Brave":
-        fetch_images_brave(keywords)
+def fetch_images_engine(engine, keywords, search=None):
+    search = search or SearchSession(keywords, [engine])
+    post_status(f"Searching {engine} for '{keywords}'...")
+    fetch_images_page(search)
+    return search
+
+def fetch_images_duckduckgo(keywords):
+    fetch_images_engine("DuckDuckGo", keywords)
+
+def fetch_images_bing(keywords):
+    fetch_images_engine("Bing", keywords)
+
+def fetch_images_brave(keywords):
+    fetch_images_engine("Brave", keywords)
+
+def fetch_images_all(keywords, search=None):
+    """Queries every engine concurrently and merges results as they arrive, without duplicates."""
+    search = search or SearchSession(keywords, SEARCH_ENGINES)
+    post_status(f"Searching all engines for '{keywords}'...")
+    fetch_images_page(search)
+    return search
+
+def fetch_images_thread(search):
+    """Runs the first page of a search started from the GUI."""
+    if len(search.engines) > 1:
+        fetch_images_all(search.keywords, search)
     else:
-        status_queue.put("Unknown search engine selected.")
-        image_queue.put("SEARCH_COMPLETE")
+        fetch_images_engine(search.engines[0], search.keywords, search)
+
+def load_next_page():
+    """Starts fetching the next page of the current search, unless one is loading or none is left."""
+    search = current_search
+    if search is None or search.loading or not search.pages or not search.has_more:
+        return
+    search.loading = True
+    post_status(f"Loading more results for '{search.keywords}'...")
+    threading.Thread(target=fetch_images_page, args=(search,), daemon=True).start()
 
 # --- GUI Functions ---
 def update_status_bar():
-    try:
-        while True:
-            message = status_queue.get_nowait()
-            status_var.set(message)
-            log_message(message)
-            root.update_idletasks()
-    except queue.Empty:
-        pass
+    """Applies a tick's worth of events at once: the newest status wins, all new log lines go
+    in with a single insert, and the widget is trimmed to the last LOG_RING_LINES lines."""
+    events = event_bus.drain()
+    statuses = [event for event in events if event.status]
+    if statuses:
+        status_var.set(statuses[-1].message)
+    if events:
+        chunks = []
+        for event in events:
+            chunks += [format_event(event) + "\n", logging.getLevelName(event.level)]
+        log_text.config(state=tk.NORMAL)
+        log_text.insert(tk.END, *chunks)
+        excess = int(log_text.index("end-1c").split(".")[0]) - 1 - LOG_RING_LINES
+        if excess > 0:
+            log_text.delete("1.0", f"{excess + 1}.0")
+        log_text.see(tk.END)
+        log_text.config(state=tk.DISABLED)
+    update_selection_counter()  # Download threads only change selected_files_info
     root.after(100, update_status_bar)
 
 def update_image_display():
+    """Moves at most THUMBNAILS_PER_TICK decoded thumbnails per tick into the grid."""
     try:
-        while True:
+        added = 0
+        while added < THUMBNAILS_PER_TICK:
             item = image_queue.get_nowait()
-            if item == "SEARCH_COMPLETE":
-                status_queue.put("Image search finished.")
-                search_button.config(state=tk.NORMAL)
+            complete = item[0] == "SEARCH_COMPLETE"
+            generation = item[1] if complete else item[0]
+            if current_search is None or generation != current_search.generation:
+                continue  # Left over from a superseded search
+            if complete:
+                post_status("Image search finished.")
                 break
-            image_data, url, thumb_url = item
-            try:
-                img = Image.open(io.BytesIO(image_data))
-                img.thumbnail(THUMBNAIL_SIZE)
-                photo = ImageTk.PhotoImage(img)
-                img_button = tk.Button(image_frame_inner, image=photo, relief=tk.RAISED, borderwidth=2)
-                img_button.image = photo
-                img_button.full_url = url
-                is_selected = any(info['url'] == url for info in selected_files_info.values())
-                num_cols = image_frame_inner.winfo_width() // (THUMBNAIL_SIZE[0] + 10)
-                if num_cols < 1: num_cols = 4
-                row = len(image_frame_inner.winfo_children()) // num_cols
-                col = len(image_frame_inner.winfo_children()) % num_cols
-                img_button.grid(row=row, column=col, padx=5, pady=5)
-                widget_id = str(img_button)
-                img_button.config(command=lambda w_id=widget_id, u=url, button=img_button: toggle_selection(w_id, u, button))
-                if is_selected:
-                    img_button.config(relief=tk.SUNKEN, bg='lightblue')
-            except Exception as e:
-                log_message(f"Error processing thumbnail for {thumb_url}: {e}")
+            _, thumb_image, url, thumb_url = item
+            grid_items.append({'url': url, 'thumb_url': thumb_url, 'image': thumb_image})
+            added += 1
     except queue.Empty:
         pass
+    redraw_grid()
     root.after(100, update_image_display)
-    image_canvas.configure(scrollregion=image_canvas.bbox("all"))
 
-def log_message(message):
-    log_text.config(state=tk.NORMAL)
-    log_text.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n")
-    log_text.see(tk.END)
-    log_text.config(state=tk.DISABLED)
+def redraw_grid():
+    """Virtualized grid: draws canvas items only for rows in (or next to) the viewport.
+
+    Cells scrolled out of view are deleted together with their PhotoImage, so widget count
+    and image memory stay constant however many results there are.
+    """
+    global grid_columns
+    cell_w, cell_h = GRID_CELL
+    columns = max(1, image_canvas.winfo_width() // cell_w)
+    if columns != grid_columns:
+        clear_grid_cells()
+        grid_columns = columns
+    rows = (len(grid_items) + columns - 1) // columns
+    image_canvas.configure(scrollregion=(0, 0, columns * cell_w, rows * cell_h))
+    top = image_canvas.canvasy(0)
+    first_row = max(0, int(top // cell_h) - 1)
+    last_row = int((top + image_canvas.winfo_height()) // cell_h) + 1
+    visible = range(first_row * columns, min(len(grid_items), (last_row + 1) * columns))
+    for index in [index for index in grid_cells if index not in visible]:
+        cell = grid_cells.pop(index)
+        image_canvas.delete(cell['image_id'], cell['frame_id'])
+    get_prefetcher().want(grid_items[index]['url'] for index in visible)
+    for index in visible:
+        selected = grid_items[index]['url'] in selected_files_info
+        cell = grid_cells.get(index)
+        if cell is None:
+            x, y = (index % columns) * cell_w, (index // columns) * cell_h
+            photo = ImageTk.PhotoImage(grid_items[index]['image'])
+            frame_id = image_canvas.create_rectangle(x + 2, y + 2, x + cell_w - 2, y + cell_h - 2,
+                                                     outline='lightblue', width=4)
+            image_id = image_canvas.create_image(x + cell_w // 2, y + cell_h // 2, image=photo)
+            cell = grid_cells[index] = {'photo': photo, 'image_id': image_id, 'frame_id': frame_id, 'selected': None}
+        if cell['selected'] != selected:
+            image_canvas.itemconfig(cell['frame_id'], state=tk.NORMAL if selected else tk.HIDDEN)
+            cell['selected'] = selected
+    if rows and last_row >= rows - SCROLL_PREFETCH_ROWS:
+        load_next_page()
 
-def download_and_save_full_image(url, widget_id):
+def clear_grid_cells():
+    image_canvas.delete("all")
+    grid_cells.clear()
+
+def grid_index_at(event):
+    """Index into grid_items of the cell under the pointer, or None."""
+    cell_w, cell_h = GRID_CELL
+    column = int(image_canvas.canvasx(event.x) // cell_w)
+    index = int(image_canvas.canvasy(event.y) // cell_h) * grid_columns + column
+    return index if column < grid_columns and 0 <= index < len(grid_items) else None
+
+def on_grid_click(event):
+    index = grid_index_at(event)
+    if index is not None:
+        toggle_selection(grid_items[index]['url'])
+        redraw_grid()
+
+def on_grid_motion(event):
+    index = grid_index_at(event)
+    if index is not None and grid_items[index]['url'] not in selected_files_info:
+        get_prefetcher().hover(grid_items[index]['url'])
+
+def scroll_grid(*args):
+    image_canvas.yview(*args)
+    redraw_grid()
+
+def on_grid_mousewheel(event):
+    if event.num == 4 or event.delta > 0:
+        scroll_grid("scroll", -1, "units")
+    else:
+        scroll_grid("scroll", 1, "units")
+
+def download_and_save_full_image(url):
     try:
-        status_queue.put(f"Downloading full image: {url[:50]}...")
-        filename_base = f"selected_{uuid.uuid4()}"
-        response = requests.get(url, stream=True, timeout=20)
-        response.raise_for_status()
-        content_type = response.headers.get('content-type')
-        if not content_type or not content_type.startswith('image'):
-            raise ValueError(f"Non-image content type: {content_type}")
-        extension = ".jpg"
-        mime_type = content_type.split(';')[0].lower()
-        if mime_type == 'image/jpeg':
-            extension = ".jpg"
-        elif mime_type == 'image/png':
-            extension = ".png"
-        elif mime_type == 'image/gif':
-            extension = ".gif"
-        filename = filename_base + extension
-        filepath = os.path.join(DOWNLOAD_FOLDER, filename)
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(8192):
-                f.write(chunk)
-        img = Image.open(filepath)
-        img.verify()
-        img.close()
-        status_queue.put(f"Saved: {filename}")
-        selected_files_info[widget_id] = {'path': filepath, 'url': url, 'thumb_widget': None}
-        update_selection_counter()
+        cache = get_image_cache()
+        get_prefetcher().wait(url)
+        filepath = cache.get(url)
+        if filepath is None:
+            post_status(f"Downloading full image: {url[:50]}...")
+            filepath = fetch_full_image(url)
+            post_status(f"Saved: {os.path.basename(filepath)}")
+        else:
+            post_status(f"Using cached image: {os.path.basename(filepath)}")
+        get_store().record_asset(url, filepath)
+        if url not in selected_files_info:
+            return  # Deselected while downloading
+        cache.pin(filepath)
+        selected_files_info[url]['path'] = filepath
     except Exception as e:
-        status_queue.put(f"Error downloading full {url}: {e}")
-        if widget_id in selected_files_info:
-            del selected_files_info[widget_id]
-        update_selection_counter()
-
-def toggle_selection(widget_id, url, button_widget):
-    if widget_id not in selected_files_info:
-        button_widget.config(relief=tk.SUNKEN, bg='lightblue')
-        selected_files_info[widget_id] = {'path': None, 'url': url, 'thumb_widget': button_widget}
-        threading.Thread(target=download_and_save_full_image, args=(url, widget_id), daemon=True).start()
+        post_status(f"Error downloading full {url}: {e}", logging.ERROR)
+        if selected_files_info.pop(url, None) is not None:
+            autosave_selection()   # So the next start doesn't restore (and retry) it
+
+def autosave_selection():
+    """Saves the current selection as AUTOSAVE_PROJECT, restored on the next start."""
+    get_store().save_project(AUTOSAVE_PROJECT, list(selected_files_info), {})
+
+def toggle_selection(url):
+    if url not in selected_files_info:
+        selected_files_info[url] = {'path': None, 'url': url}
+        threading.Thread(target=download_and_save_full_image, args=(url,), daemon=True).start()
     else:
-        button_widget.config(relief=tk.RAISED, bg=root.cget('bg'))
-        info = selected_files_info.pop(widget_id)
-        if info.get('path') and os.path.exists(info['path']):
-            try:
-                os.remove(info['path'])
-                status_queue.put(f"Removed deselected file: {os.path.basename(info['path'])}")
-            except OSError as e:
-                status_queue.put(f"Error removing file {info['path']}: {e}")
+        info = selected_files_info.pop(url)
+        if info.get('path'):
+            # The file stays in the image cache so re-selecting it is instant.
+            get_image_cache().unpin(info['path'])
+    update_selection_counter()
+    autosave_selection()
+
+def restore_selection(urls):
+    """Makes urls the current selection, in order. Images whose cached file is gone are downloaded again."""
+    cache = get_image_cache()
+    for info in selected_files_info.values():
+        if info.get('path'):
+            cache.unpin(info['path'])
+    selected_files_info.clear()
+    store = get_store()
+    for url in urls:
+        asset = store.asset(url)
+        if asset and os.path.exists(asset["path"]):
+            cache.pin(asset["path"])
+            selected_files_info[url] = {'path': asset["path"], 'url': url}
+        else:
+            selected_files_info[url] = {'path': None, 'url': url}
+            threading.Thread(target=download_and_save_full_image, args=(url,), daemon=True).start()
     update_selection_counter()
+    if grid_items:
+        redraw_grid()
+
+def gui_render_options():
+    """The option widgets' values, in batch job keys (see BATCH_JOB_DEFAULTS)."""
+    try:
+        trans_duration = float(transition_duration_var.get())
+    except ValueError:
+        trans_duration = 0.5
+    return {"duration": TARGET_DURATION_SEC, "transition": transition_style_var.get(),
+            "transition_duration": trans_duration, "overlay_text": text_overlay_var.get(),
+            "filter": filter_var.get(), "music": bg_music_path_var.get(), "incremental": incremental_var.get(),
+            "trace": trace_var.get(), "profile": profile_var.get(), "beat_sync": beat_sync_var.get()}
+
+def save_project():
+    name = simpledialog.askstring("Save Project", "Project name:", initialvalue=project_var.get(), parent=root)
+    if not name or not name.strip():
+        return
+    name = name.strip()
+    get_store().save_project(name, list(selected_files_info), gui_render_options())
+    project_combo.configure(values=get_store().project_names())
+    project_var.set(name)
+    post_status(f"Saved project '{name}' ({len(selected_files_info)} images).")
+
+def open_project():
+    name = project_var.get()
+    project = get_store().load_project(name) if name else None
+    if project is None:
+        messagebox.showwarning("Open Project", "Choose a saved project first.")
+        return
+    urls, options = project
+    transition_style_var.set(options.get("transition", "Crossfade"))
+    transition_duration_var.set(str(options.get("transition_duration", 0.5)))
+    text_overlay_var.set(options.get("overlay_text", ""))
+    filter_var.set(options.get("filter", "None"))
+    bg_music_path_var.set(options.get("music", ""))
+    incremental_var.set(bool(options.get("incremental", INCREMENTAL_RENDER)))
+    profile_var.set(options.get("profile", DEFAULT_PROFILE))
+    beat_sync_var.set(bool(options.get("beat_sync", False)))
+    trace_var.set(bool(options.get("trace", False)))
+    restore_selection(urls)
+    autosave_selection()
+    post_status(f"Opened project '{name}' ({len(urls)} images).")
 
 def update_selection_counter():
-    count = len(selected_files_info)
-    selection_counter_var.set(f"{count} images selected")
+    text = f"{len(selected_files_info)} images selected"
+    if selection_counter_var.get() != text:
+        selection_counter_var.set(text)
 
 def start_search():
+    """Starts a new search generation; a search still in flight is cancelled and its late results ignored."""
+    global current_search
     keywords = search_entry.get()
     if not keywords:
         messagebox.showwarning("Input Needed", "Please enter search keywords.")
         return
-    for widget in image_frame_inner.winfo_children():
-        widget.destroy()
+    engine = search_engine_var.get()
+    if engine != ALL_ENGINES and engine not in SEARCH_ENGINES:
+        post_status("Unknown search engine selected.")
+        return
+    if current_search is not None:
+        current_search.cancel()
+    current_search = SearchSession(keywords, SEARCH_ENGINES if engine == ALL_ENGINES else [engine])
+    grid_items.clear()
+    clear_grid_cells()
     image_canvas.yview_moveto(0)
-    image_canvas.configure(scrollregion=image_canvas.bbox("all"))
-    search_button.config(state=tk.DISABLED)
-    status_queue.put("Starting search...")
-    threading.Thread(target=fetch_images_thread, args=(keywords,), daemon=True).start()
+    image_canvas.configure(scrollregion=(0, 0, 0, 0))
+    post_status("Starting search...")
+    threading.Thread(target=fetch_images_thread, args=(current_search,), daemon=True).start()
 
 def choose_bg_music():
     path = filedialog.askopenfilename(title="Select Background Music", filetypes=[("Audio Files", "*.mp3 *.wav *.m4a")])
     if path:
         bg_music_path_var.set(path)
 
-def start_video_creation():
+def start_video_creation(preview=False):
     global video_thread
     if video_thread and video_thread.is_alive():
         messagebox.showwarning("Busy", "Video creation is already in progress.")
         return
-    valid_selected_paths = [info['path'] for info in selected_files_info.values() if info.get('path') and os.path.exists(info['path'])]
+    # Downloaded selections are indexed (and pinned in the cache); render_video reports files gone since
+    valid_selected_paths = get_store().asset_paths(url for url, info in selected_files_info.items() if info.get('path'))
     if not valid_selected_paths:
         messagebox.showerror("Error", "No images selected or downloaded files are missing.")
         return
     if len(valid_selected_paths) < 2:
         messagebox.showwarning("Not Enough Images", "Please select at least 2 images to create a video.")
         return
-    confirm = messagebox.askyesno("Confirm Video Creation", f"Create video from {len(valid_selected_paths)} selected images?\nOutput: {OUTPUT_VIDEO_FILENAME}")
+    if preview:
+        output_filename = PREVIEW_VIDEO_FILENAME
+        confirm = True
+    else:
+        output_filename = OUTPUT_VIDEO_FILENAME
+        confirm = messagebox.askyesno("Confirm Video Creation", f"Create video from {len(valid_selected_paths)} selected images?\nOutput: {OUTPUT_VIDEO_FILENAME}")
     if confirm:
         make_video_button.config(state=tk.DISABLED)
-        status_queue.put("Preparing video creation...")
+        preview_button.config(state=tk.DISABLED)
+        post_status("Preparing preview..." if preview else "Preparing video creation...")
         if not os.path.exists(DOWNLOAD_FOLDER):
             os.makedirs(DOWNLOAD_FOLDER)
         # Gather viral options from GUI widgets
-        trans_style = transition_style_var.get()
-        try:
-            trans_duration = float(transition_duration_var.get())
-        except:
-            trans_duration = 0.5
-        overlay = text_overlay_var.get()
-        filt = filter_var.get()
-        bg_music = bg_music_path_var.get()
+        options = gui_render_options()
+        render_options = {"incremental": options["incremental"], "trace": options["trace"],
+                          "beat_sync": options["beat_sync"], "preview": preview}
+        if not preview:
+            render_options["profile"] = options["profile"]  # Previews use render_preview's draft default
         video_thread = threading.Thread(target=create_tiktok_video_threaded,
-                                         args=(valid_selected_paths, OUTPUT_VIDEO_FILENAME, TARGET_DURATION_SEC, VIDEO_RESOLUTION,
-                                               trans_style, trans_duration, overlay, filt, bg_music),
+                                         args=(valid_selected_paths, output_filename, options["duration"], VIDEO_RESOLUTION,
+                                               options["transition"], options["transition_duration"],
+                                               options["overlay_text"], options["filter"], options["music"]),
+                                         kwargs=render_options,
                                          daemon=True)
         video_thread.start()
         check_video_thread()
@@ -424,12 +2483,14 @@ def check_video_thread():
         root.after(500, check_video_thread)
     else:
         make_video_button.config(state=tk.NORMAL)
+        preview_button.config(state=tk.NORMAL)
 
 # --- Main GUI Setup ---
 def setup_gui():
-    global root, search_entry, selection_counter_var, status_var, image_frame_inner, image_canvas
-    global log_text, search_button, make_video_button, search_engine_var
+    global root, search_entry, selection_counter_var, status_var, image_canvas
+    global log_text, search_button, make_video_button, preview_button, search_engine_var
     global transition_style_var, transition_duration_var, text_overlay_var, filter_var, bg_music_path_var
+    global incremental_var, trace_var, profile_var, project_var, project_combo, beat_sync_var
 
     root = tk.Tk()
     root.title("Viral TikTok Video Maker")
@@ -447,7 +2508,7 @@ def setup_gui():
     ttk.Label(search_frame, text="Engine:").pack(side=tk.LEFT, padx=5)
     search_engine_var = tk.StringVar(value="DuckDuckGo")
     engine_combobox = ttk.Combobox(search_frame, textvariable=search_engine_var,
-                                   values=["DuckDuckGo", "Bing", "Brave"], state="readonly", width=12)
+                                   values=list(SEARCH_ENGINES) + [ALL_ENGINES], state="readonly", width=12)
     engine_combobox.pack(side=tk.LEFT, padx=5)
 
     # --- Viral Options Frame ---
@@ -473,23 +2534,31 @@ def setup_gui():
     bg_music_path_var = tk.StringVar(value="")
     ttk.Entry(options_frame, textvariable=bg_music_path_var, width=30).grid(row=2, column=1, padx=5, pady=2, columnspan=2)
     ttk.Button(options_frame, text="Browse", command=choose_bg_music).grid(row=2, column=3, padx=5, pady=2)
+    incremental_var = tk.BooleanVar(value=INCREMENTAL_RENDER)
+    ttk.Checkbutton(options_frame, text="Reuse unchanged segments", variable=incremental_var).grid(row=2, column=4, padx=5, pady=2, sticky=tk.W)
+    trace_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(options_frame, text="Write render trace", variable=trace_var).grid(row=3, column=4, padx=5, pady=2, sticky=tk.W)
+    ttk.Label(options_frame, text="Output Profile:").grid(row=3, column=0, padx=5, pady=2, sticky=tk.W)
+    profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+    ttk.Combobox(options_frame, textvariable=profile_var, values=list(OUTPUT_PROFILES),
+                 state="readonly", width=12).grid(row=3, column=1, padx=5, pady=2)
+    beat_sync_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(options_frame, text="Cut on the beat", variable=beat_sync_var).grid(row=3, column=2, padx=5, pady=2, sticky=tk.W)
 
     # --- Middle Frame: Image Display (Scrollable) ---
     image_display_frame = ttk.Frame(root, padding="5")
     image_display_frame.pack(fill=tk.BOTH, expand=True)
     image_canvas = tk.Canvas(image_display_frame)
-    scrollbar = ttk.Scrollbar(image_display_frame, orient="vertical", command=image_canvas.yview)
-    image_frame_inner = ttk.Frame(image_canvas)
-    image_canvas.configure(yscrollcommand=scrollbar.set)
+    scrollbar = ttk.Scrollbar(image_display_frame, orient="vertical", command=scroll_grid)
+    image_canvas.configure(yscrollcommand=scrollbar.set, yscrollincrement=GRID_CELL[1] // 2)
     scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     image_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-    canvas_window = image_canvas.create_window((0, 0), window=image_frame_inner, anchor="nw")
-    def on_frame_configure(event):
-        image_canvas.configure(scrollregion=image_canvas.bbox("all"))
-    def on_canvas_configure(event):
-        image_canvas.itemconfig(canvas_window, width=event.width)
-    image_frame_inner.bind("<Configure>", on_frame_configure)
-    image_canvas.bind("<Configure>", on_canvas_configure)
+    image_canvas.bind("<Configure>", lambda event: redraw_grid())
+    image_canvas.bind("<Button-1>", on_grid_click)
+    image_canvas.bind("<Motion>", on_grid_motion)
+    image_canvas.bind("<MouseWheel>", on_grid_mousewheel)
+    image_canvas.bind("<Button-4>", on_grid_mousewheel)
+    image_canvas.bind("<Button-5>", on_grid_mousewheel)
 
     # --- Control Frame: Counter & Convert Button ---
     control_frame = ttk.Frame(root, padding="10")
@@ -499,12 +2568,24 @@ def setup_gui():
     update_selection_counter()
     make_video_button = ttk.Button(control_frame, text="Convert Video", command=start_video_creation)
     make_video_button.pack(side=tk.RIGHT, padx=10)
+    preview_button = ttk.Button(control_frame, text="Preview", command=lambda: start_video_creation(preview=True))
+    preview_button.pack(side=tk.RIGHT, padx=10)
+    ttk.Button(control_frame, text="Save As...", command=save_project).pack(side=tk.RIGHT, padx=2)
+    ttk.Button(control_frame, text="Open", command=open_project).pack(side=tk.RIGHT, padx=2)
+    project_var = tk.StringVar(value="")
+    project_combo = ttk.Combobox(control_frame, textvariable=project_var, values=get_store().project_names(),
+                                 state="readonly", width=16)
+    project_combo.pack(side=tk.RIGHT, padx=2)
+    ttk.Label(control_frame, text="Project:").pack(side=tk.RIGHT, padx=2)
 
     # --- Log Frame ---
     log_frame = ttk.Frame(root, padding="0 5 0 5")
     log_frame.pack(fill=tk.X, side=tk.BOTTOM)
     log_text = scrolledtext.ScrolledText(log_frame, height=6, state=tk.DISABLED, wrap=tk.WORD)
     log_text.pack(fill=tk.X, expand=True)
+    log_text.tag_configure("WARNING", foreground="darkorange")
+    log_text.tag_configure("ERROR", foreground="red")
+    event_bus.ui_attached = True
 
     # --- Status Bar ---
     status_var = tk.StringVar()
@@ -514,6 +2595,10 @@ def setup_gui():
 
     root.after(100, update_status_bar)
     root.after(100, update_image_display)
+    autosaved = get_store().load_project(AUTOSAVE_PROJECT)
+    if autosaved and autosaved[0]:
+        restore_selection(autosaved[0])
+        post_status(f"Restored {len(autosaved[0])} selected images from the last session.")
 
     if not os.path.exists(DOWNLOAD_FOLDER):
         try:
@@ -526,6 +2611,592 @@ def setup_gui():
 
     root.mainloop()
 
+# --- Headless Batch Rendering ---
+BATCH_JOB_DEFAULTS = {
+    "duration": TARGET_DURATION_SEC,
+    "resolution": VIDEO_RESOLUTION,
+    "transition": "Crossfade",
+    "transition_duration": 0.5,
+    "overlay_text": "",
+    "filter": "None",
+    "music": "",
+    "segment_workers": SEGMENT_WORKERS,
+    "incremental": INCREMENTAL_RENDER,
+    "trace": False,
+    "profile": DEFAULT_PROFILE,
+    "beat_sync": False,
+}
+
+def load_manifest(manifest_path):
+    """Loads a batch manifest (JSON, or YAML when PyYAML is installed) into a list of job dicts.
+
+    The manifest is either a list of jobs or {"defaults": {...}, "jobs": [...]}. Each job needs
+    "images" and "output"; every other key falls back to the defaults. Relative paths are
+    resolved against the manifest's folder.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.lower().endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("YAML manifests need PyYAML: pip install pyyaml")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    defaults = dict(BATCH_JOB_DEFAULTS, **(data.get("defaults") or {}))
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    def resolve(path):
+        return path if not path or os.path.isabs(path) else os.path.join(base_dir, path)
+
+    jobs = []
+    for i, entry in enumerate(data.get("jobs") or []):
+        job = dict(defaults, **entry)
+        if not job.get("images") or not job.get("output"):
+            raise ValueError(f"Job {i + 1} in {manifest_path} needs 'images' and 'output'.")
+        job.setdefault("id", job["output"])
+        job["images"] = [resolve(path) for path in job["images"]]
+        job["output"] = resolve(job["output"])
+        job["music"] = resolve(job.get("music") or "")
+        job["resolution"] = tuple(job["resolution"])
+        jobs.append(job)
+    return jobs
+
+def run_batch_job(job, preview=False):
+    """Process-pool entry point: renders one manifest job. Returns (job_id, ok, seconds)."""
+    job_id = job["id"]
+    def status(message):
+        print(f"[{job_id}] {message}", flush=True)
+    output_dir = os.path.dirname(job["output"])
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    render_options = {"segment_workers": int(job["segment_workers"] or 0), "incremental": bool(job["incremental"]),
+                      "trace": bool(job["trace"]), "concurrent": int(job.get("concurrent") or 1),
+                      "beat_sync": bool(job["beat_sync"])}
+    if preview:
+        ok = render_preview(job["images"], float(job["duration"]), job["transition"], float(job["transition_duration"]),
+                            job["overlay_text"], job["filter"], job["music"], output_filename=job["output"],
+                            status=status, logger=None, **render_options)
+    else:
+        ok = render_video(job["images"], job["output"], float(job["duration"]), job["resolution"],
+                          job["transition"], float(job["transition_duration"]), job["overlay_text"],
+                          job["filter"], job["music"], status=status, logger=None, profile=job["profile"],
+                          **render_options)
+    return job_id, ok, time.perf_counter() - start
+
+def read_finished_jobs(log_path):
+    """Returns the ids of jobs recorded as finished in the batch log."""
+    finished = set()
+    if not os.path.exists(log_path):
+        return finished
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                continue  # Torn last line from an interrupted run
+    return finished
+
+def run_batch(manifest_path, workers=None, log_path=None, preview=False, trace=False):
+    """Renders every job in the manifest on a process pool.
+
+    Finished jobs are appended to log_path (default: <manifest>.done.jsonl) as they complete,
+    so re-running the same command after an interruption only renders what is left.
+    With preview=True each job is rendered as a fast preview next to its output
+    (<output>.preview.mp4), tracked in its own log. trace=True writes a render trace for
+    every job (see render_video). Returns the number of failed jobs.
+    """
+    jobs = load_manifest(manifest_path)
+    for job in jobs:
+        job["trace"] = job["trace"] or trace
+    if preview:
+        for job in jobs:
+            job["output"] = os.path.splitext(job["output"])[0] + ".preview.mp4"
+    log_path = log_path or os.path.splitext(manifest_path)[0] + (".preview" if preview else "") + ".done.jsonl"
+    finished = read_finished_jobs(log_path)
+    pending = [job for job in jobs if not (job["id"] in finished and os.path.exists(job["output"]))]
+    print(f"{len(jobs)} jobs in manifest, {len(jobs) - len(pending)} already finished, {len(pending)} to render.")
+    if not pending:
+        return 0
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+    for job in pending:
+        job["concurrent"] = workers  # Encoders split the host's cores between the parallel jobs
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(log_path, "a", encoding="utf-8") as log:
+        futures = {pool.submit(run_batch_job, job, preview): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                job_id, ok, seconds = future.result()
+            except Exception as e:
+                job_id, ok, seconds = job["id"], False, 0.0
+                print(f"[{job_id}] Worker crashed: {e}", flush=True)
+            if ok:
+                log.write(json.dumps({"id": job_id, "output": job["output"], "seconds": round(seconds, 2),
+                                      "finished": time.strftime("%Y-%m-%d %H:%M:%S")}) + "\n")
+                log.flush()
+            else:
+                failed += 1
+    print(f"Batch done: {len(pending) - failed} rendered, {failed} failed.")
+    return failed
+
+def project_job(name, output=None):
+    """A batch job for a saved project. Images missing from the cache are downloaded again."""
+    project = get_store().load_project(name)
+    if project is None:
+        raise ValueError(f"No saved project named '{name}'.")
+    urls, options = project
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    job = dict(BATCH_JOB_DEFAULTS, **options)
+    job.update(id=name, images=[ensure_asset(url) for url in urls], output=output or f"{safe_name}.mp4")
+    job["resolution"] = tuple(job["resolution"])
+    return job
+
+def run_project(name, output=None, preview=False):
+    """Renders a saved project headlessly. Returns True on success."""
+    job = project_job(name, output)
+    if preview:
+        job["output"] = os.path.splitext(job["output"])[0] + ".preview.mp4"
+    return run_batch_job(job, preview)[1]
+
+# --- Benchmarks ---
+def _make_stub_image_bytes(size=(150, 150), fmt="JPEG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buf, fmt)
+    return buf.getvalue()
+
+def _stub_picture_bytes(picture_id, quality=85, size=(150, 150)):
+    """A smooth random picture per id; the same id at another JPEG quality is a look-alike."""
+    pattern = (np.random.RandomState(picture_id).rand(8, 8, 3) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pattern).resize(size, Image.BILINEAR).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+def start_stub_server(latency, respond):
+    """Starts a local keep-alive HTTP server. Every GET waits `latency` seconds, then answers
+    with respond(path) -> (content_type, body), or 404 when that returns None."""
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def do_GET(self):
+            time.sleep(latency)
+            response = respond(self.path)
+            if response is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            content_type, body = response
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stub_picture_id(engine, i, pictures):
+    """Which of the stub's `pictures` distinct pictures result i of an engine shows."""
+    return (i * 7 + len(engine)) % pictures
+
+def stub_picture_of(thumb_url, pictures):
+    """stub_picture_id for a thumbnail URL served by start_search_stub()."""
+    engine, name = urlsplit(thumb_url).path.split("/")[-2:]
+    return stub_picture_id(engine, int(name.split(".")[0]), pictures)
+
+def start_search_stub(latency=0.05, results=40, pictures=25):
+    """Stub for all three engines: /bing, /brave and /ddg list `results` items each, drawn from
+    `pictures` distinct pictures. Bing and Brave share full-image URLs (written differently),
+    DuckDuckGo lists the same pictures on a mirror, and each engine serves its thumbnails at
+    its own JPEG quality, so both dedupe passes have work to do."""
+    qualities = {"bing": 70, "brave": 85, "ddg": 95}
+    def picture_of(engine, i):
+        return stub_picture_id(engine, i, pictures)
+
+    def respond(path):
+        parts = urlsplit(path)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        engine = parts.path.strip("/")
+        if engine in qualities:
+            query = dict(parse_qsl(parts.query))
+            offset, count = int(query.get("offset", 0)), int(query.get("count", results))
+            items = [{"thumb": f"{base}/thumb/{engine}/{i}.jpg",
+                      "full": f"{base}/full/{picture_of(engine, i)}.jpg?size=l&v=1" if engine == "bing"
+                      else f"http://127.0.0.1:{server.server_address[1]}/full/{picture_of(engine, i)}.jpg?v=1&size=l#{engine}"
+                      if engine == "brave" else f"{base}/mirror/{picture_of(engine, i)}.jpeg"}
+                     for i in range(offset, min(results, offset + count))]
+            if engine == "bing":
+                data = {"value": [{"thumbnailUrl": item["thumb"], "contentUrl": item["full"]} for item in items]}
+            elif engine == "brave":
+                data = {"images": [{"thumbnail": item["thumb"], "url": item["full"]} for item in items]}
+            else:
+                data = [{"thumbnail": item["thumb"], "image": item["full"]} for item in items]
+            return "application/json", json.dumps(data).encode("utf-8")
+        segments = parts.path.strip("/").split("/")
+        if len(segments) == 3 and segments[0] == "thumb" and segments[1] in qualities:
+            i = int(segments[2].split(".")[0])
+            return "image/jpeg", _stub_picture_bytes(picture_of(segments[1], i), qualities[segments[1]])
+        return None
+
+    server = start_stub_server(latency, respond)
+    return server
+
+def drain_image_queue():
+    """Empties image_queue after a headless search. Returns the delivered result tuples."""
+    items = []
+    while True:
+        try:
+            item = image_queue.get_nowait()
+        except queue.Empty:
+            return items
+        if item[0] != "SEARCH_COMPLETE":
+            items.append(item[1:])
+
+def run_search_case(base, engine, pictures):
+    """Process-pool entry point: one benchmark search against the start_search_stub() server
+    at `base`. Points this worker's engine settings at the stub, with a cold image cache and
+    an in-memory index; the worker is discarded afterwards, so the caller's settings are
+    never touched. DuckDuckGo keeps going through search_duckduckgo; only the DDGS client
+    underneath it reads the stub. Returns its measurements."""
+    global BING_API_KEY, BING_ENDPOINT, BRAVE_ENDPOINT, DDGS, _image_cache, _store
+    class StubDDGS:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def images(self, keywords, region="wt-wt", safesearch="moderate", max_results=None, **filters):
+            response = get_http_session().get(f"{base}/ddg", params={"q": keywords, "count": max_results or 100},
+                                              timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            return [dict(item, title=keywords, source="Stub") for item in response.json()]
+
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    BING_API_KEY, BING_ENDPOINT, BRAVE_ENDPOINT, DDGS = "stub", f"{base}/bing", f"{base}/brave", StubDDGS
+    _image_cache = ImageCache(cache_dir)
+    _store = (os.getpid(), ProjectStore(":memory:"))
+    try:
+        start = time.perf_counter()
+        if engine == ALL_ENGINES:
+            fetch_images_all("stub")
+        else:
+            fetch_images_engine(engine, "stub")
+        seconds = time.perf_counter() - start
+        items = drain_image_queue()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    unique = len({stub_picture_of(thumb_url, pictures) for _, _, thumb_url in items})
+    return {"seconds": round(seconds, 3), "delivered": len(items), "distinct": unique}
+
+def run_search_benchmark(latency=0.05, results=40, pictures=25):
+    """Runs single-engine and federated search against the local engine stubs, each search
+    in a fresh process (see run_search_case)."""
+    server = start_search_stub(latency, results, pictures)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    report = {}
+    try:
+        for engine in list(SEARCH_ENGINES) + [ALL_ENGINES]:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                case = report[engine] = pool.submit(run_search_case, base, engine, pictures).result()
+            print(f"  {engine:12s} {case['seconds']:6.2f} s  {case['delivered']:3d} thumbnails "
+                  f"({case['distinct']} distinct pictures)")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return report
+
+def run_fetch_case(candidates):
+    """Process-pool entry point: fetch_thumbnails() over `candidates` with a cold image cache,
+    so every thumbnail goes over the network. Returns (seconds, delivered)."""
+    global _image_cache
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    _image_cache = ImageCache(cache_dir)
+    try:
+        start = time.perf_counter()
+        delivered = fetch_thumbnails(candidates, limit=len(candidates), out_queue=queue.Queue())
+        return time.perf_counter() - start, delivered
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def run_fetch_benchmark(count=30, latency=0.2, hosts=2):
+    """Compares the old one-at-a-time requests.get loop against fetch_thumbnails()."""
+    body = _make_stub_image_bytes()
+    servers = [start_stub_server(latency, lambda path: ("image/jpeg", body)) for _ in range(hosts)]
+    try:
+        candidates = [(f"http://127.0.0.1:{servers[i % hosts].server_address[1]}/thumb/{i}.jpg", f"full/{i}.jpg")
+                      for i in range(count)]
+        start = time.perf_counter()
+        for thumb_url, _ in candidates:
+            requests.get(thumb_url, timeout=10).raise_for_status()
+        sequential = time.perf_counter() - start
+
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            pooled, delivered = pool.submit(run_fetch_case, candidates).result()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    print(f"{count} thumbnails, {latency * 1000:.0f} ms latency, {hosts} host(s)")
+    print(f"  sequential requests.get: {sequential:7.2f} s")
+    print(f"  pooled fetch layer:      {pooled:7.2f} s  ({delivered} delivered, {sequential / pooled:.1f}x faster)")
+    return {"sequential_sec": sequential, "pooled_sec": pooled, "delivered": delivered}
+
+def _legacy_still_clip(path, resolution, duration, filter_option):
+    """The pre-frame-engine MoviePy chain (resize -> crop -> resize -> zoom fx -> colorx), for comparison."""
+    clip = ImageClip(path, duration=duration)
+    target_w, target_h = resolution
+    if clip.w / clip.h > target_w / target_h:
+        clip = clip.resize(height=target_h)
+        clip = clip.crop(x_center=clip.w/2, width=target_w)
+    else:
+        clip = clip.resize(width=target_w)
+        clip = clip.crop(y_center=clip.h/2, height=target_h)
+    clip = clip.resize(resolution)
+    clip = clip.fx(mv_resize, lambda t: zoom_scale(t, duration))
+    if filter_option in FILTER_FACTORS:
+        clip = clip.fx(mv_colorx, FILTER_FACTORS[filter_option])
+    return clip
+
+def run_frame_benchmark(source_size=(4000, 3000), resolution=VIDEO_RESOLUTION, frames=24, filter_option="Vintage"):
+    """Per-frame timing of the legacy MoviePy chain vs StillFrameSource, plus an output diff."""
+    work_dir = tempfile.mkdtemp(prefix="bench_frames_")
+    try:
+        path = os.path.join(work_dir, "source.jpg")
+        gradient = np.linspace(0, 255, source_size[0], dtype=np.uint8)
+        pixels = np.dstack([np.tile(gradient, (source_size[1], 1))] * 3)
+        pixels[:, :, 1] = pixels[:, :, 1][::-1]
+        Image.fromarray(pixels).save(path, quality=90)
+        duration = 2.0
+        times = [duration * i / frames for i in range(frames)]
+
+        start = time.perf_counter()
+        legacy = _legacy_still_clip(path, resolution, duration, filter_option)
+        legacy_frames = []
+        for t in times:
+            frame = legacy.get_frame(t)
+            # The composite centers the grown frame on the canvas; crop the same way.
+            y0, x0 = (frame.shape[0] - resolution[1]) // 2, (frame.shape[1] - resolution[0]) // 2
+            legacy_frames.append(frame[y0:y0 + resolution[1], x0:x0 + resolution[0]].astype(np.uint8))
+        legacy_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        source = StillFrameSource(path, resolution, duration, filter_option)
+        engine_frames = [source.get_frame(t) for t in times]
+        engine_sec = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    diffs = [np.abs(a.astype(np.int16) - b.astype(np.int16)) for a, b in zip(legacy_frames, engine_frames)]
+    mean_diff = float(np.mean([d.mean() for d in diffs]))
+    print(f"{frames} frames, {source_size[0]}x{source_size[1]} JPEG -> {resolution[0]}x{resolution[1]}, filter {filter_option}")
+    print(f"  MoviePy chain:  {legacy_sec * 1000 / frames:7.1f} ms/frame (incl. decode)")
+    print(f"  frame engine:   {engine_sec * 1000 / frames:7.1f} ms/frame (incl. decode)  ({legacy_sec / engine_sec:.1f}x faster)")
+    print(f"  mean abs pixel difference: {mean_diff:.2f} / 255")
+    return {"legacy_ms_per_frame": legacy_sec * 1000 / frames, "engine_ms_per_frame": engine_sec * 1000 / frames,
+            "mean_abs_diff": mean_diff}
+
+def make_bench_inputs(folder, seed=0):
+    """Writes the benchmark's synthetic sources into folder and returns (image_paths, music_path).
+
+    Deterministic for a given seed: JPEG and PNG stills at several sizes (one with alpha),
+    an animated GIF and a 440 Hz tone, so every run renders exactly the same inputs.
+    """
+    rng = np.random.RandomState(seed)
+    def picture(size):
+        w, h = size
+        gradient = np.linspace(0, 255, w)[None, :, None] * np.linspace(0.4, 1.0, h)[:, None, None]
+        noise = rng.randint(0, 48, (h, w, 3))
+        return np.clip(gradient * rng.uniform(0.5, 1.0, 3) + noise, 0, 255).astype(np.uint8)
+
+    paths = []
+    for n, (fmt, size) in enumerate([("jpg", (4000, 3000)), ("png", (1920, 1080)), ("jpg", (1080, 1920)),
+                                     ("png", (640, 640)), ("gif", (480, 270)), ("jpg", (800, 1200))]):
+        path = os.path.join(folder, f"source_{n}.{fmt}")
+        if fmt == "gif":
+            frames = [Image.fromarray(np.roll(picture(size), shift * 40, axis=1)).convert("P", palette=Image.ADAPTIVE)
+                      for shift in range(12)]
+            frames[0].save(path, save_all=True, append_images=frames[1:], duration=80, loop=0)
+        elif fmt == "png":
+            img = Image.fromarray(picture(size))
+            if n == 3:
+                img.putalpha(Image.fromarray(picture(size)[:, :, 0]))
+            img.save(path)
+        else:
+            Image.fromarray(picture(size)).save(path, quality=90)
+        paths.append(path)
+
+    music_path = os.path.join(folder, "tone.wav")
+    rate = 44100
+    samples = (np.sin(2 * np.pi * 440 * np.arange(rate * 20) / rate) * 12000).astype(np.int16)
+    with wave.open(music_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+    return paths, music_path
+
+def run_render_case(images, output, duration, resolution, transition, filter_option, overlay_text, music, fps,
+                    cache_dir):
+    """Process-pool entry point: one traced benchmark render with its caches in the empty
+    cache_dir, so no case reuses audio or segments from the user's or an earlier render.
+    Returns its measurements."""
+    messages = []
+    start = time.perf_counter()
+    traced = run_traced(functools.partial(render_video, cache_dir=cache_dir), images, output, duration, resolution,
+                        transition, 0.5, overlay_text, filter_option, music, messages.append, None, 0, False, fps)
+    wall = time.perf_counter() - start
+    frames = traced.counters.get("frames", 0)
+    stages = {}
+    for event in traced.events:
+        stages[event["name"]] = stages.get(event["name"], 0.0) + event["dur"] / 1000
+    peak_rss = None
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"ok": traced.result, "error": None if traced.result else messages[-1], "wall_sec": round(wall, 3),
+            "frames": frames, "fps": round(frames / wall, 2),
+            "peak_rss_mb": round(peak_rss / 2**20, 1) if peak_rss else None,
+            "output_bytes": os.path.getsize(output) if traced.result else None,
+            "stages_ms": {name: round(ms, 1) for name, ms in sorted(stages.items())}}
+
+def _git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmark_suite(out_path="benchmark_results.json", resolution=(540, 960), duration=8.0, fps=VIDEO_FPS,
+                        latency=0.05, quick=False, compare_path=None):
+    """Renders the synthetic inputs with every option combination (transition x filter x
+    overlay x music), then runs the search and fetch benchmarks, and writes all results
+    to out_path as JSON.
+
+    Each render runs in a fresh process so its peak RSS is its own. With compare_path, the
+    results are also printed next to an earlier run's.
+    """
+    transitions, filters = ("Crossfade", "None"), ("None", "Vintage", "Bright")
+    overlays, musics = (False, True), (False, True)
+    if quick:
+        filters, overlays = ("None", "Vintage"), (False,)
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    results = {"meta": {"revision": _git_revision(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count(), "resolution": list(resolution), "duration": duration,
+                        "fps": fps, "latency": latency},
+               "render": {}}
+    try:
+        images, music = make_bench_inputs(work_dir)
+        print(f"Rendering {len(images)} synthetic inputs, {duration:g} s at {resolution[0]}x{resolution[1]}, {fps} fps")
+        for transition, filter_option, overlay, with_music in itertools.product(transitions, filters, overlays, musics):
+            name = f"{transition}/{filter_option}/{'overlay' if overlay else 'no-overlay'}/{'music' if with_music else 'silent'}"
+            output = os.path.join(work_dir, "case.mp4")
+            cache_dir = os.path.join(work_dir, "cache")
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                case = pool.submit(run_render_case, images, output, duration, resolution, transition, filter_option,
+                                   "Benchmark" if overlay else "", music if with_music else "", fps,
+                                   cache_dir).result()
+            results["render"][name] = case
+            if case["ok"]:
+                print(f"  {name:40s} {case['wall_sec']:6.2f} s  {case['fps']:6.1f} fps  "
+                      f"{case['peak_rss_mb'] or 0:6.0f} MB RSS  {case['output_bytes'] / 1024:7.0f} KB")
+            else:
+                print(f"  {name:40s} failed: {case['error']}")
+        print(f"Search, {latency * 1000:.0f} ms stub latency:")
+        results["search"] = run_search_benchmark(latency)
+        results["fetch"] = run_fetch_benchmark(latency=latency)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {out_path}")
+    if compare_path:
+        compare_benchmarks(compare_path, results)
+    return results
+
+def compare_benchmarks(baseline_path, results):
+    """Prints render fps and search time of results against an earlier run_benchmark_suite() file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline_path} (revision {baseline['meta'].get('revision')}):")
+    for name, case in results["render"].items():
+        old = baseline.get("render", {}).get(name)
+        if case["ok"] and old and old.get("ok"):
+            print(f"  {name:40s} {old['fps']:6.1f} -> {case['fps']:6.1f} fps  ({case['fps'] / old['fps']:.2f}x)")
+    for engine, run in results.get("search", {}).items():
+        old = baseline.get("search", {}).get(engine)
+        if old:
+            print(f"  search {engine:33s} {old['seconds']:6.2f} -> {run['seconds']:6.2f} s")
+
 # --- Run the Application ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Viral TikTok Video Maker")
+    parser.add_argument("--log-file", default=None, help="Also write every status/log message to this rotating log file")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("gui", help="Start the GUI (default)")
+    batch = subparsers.add_parser("batch", help="Render every job in a JSON/YAML manifest without the GUI")
+    batch.add_argument("manifest", help="Manifest file (JSON, or YAML with PyYAML installed)")
+    batch.add_argument("--workers", type=int, default=None, help="Parallel render processes (default: CPU count)")
+    batch.add_argument("--log", default=None, help="Finished-job log used to resume (default: <manifest>.done.jsonl)")
+    batch.add_argument("--preview", action="store_true", help="Render fast low-resolution previews instead")
+    batch.add_argument("--trace", action="store_true", help="Write <output>.trace.json with per-stage timings")
+    project = subparsers.add_parser("project", help="List or render projects saved from the GUI")
+    project.add_argument("action", choices=["list", "render"])
+    project.add_argument("name", nargs="?", help="Project to render")
+    project.add_argument("--output", default=None, help="Output file (default: <name>.mp4)")
+    project.add_argument("--preview", action="store_true", help="Render a fast low-resolution preview instead")
+    bench_fetch = subparsers.add_parser("bench-fetch", help="Benchmark thumbnail fetching against a local stub server")
+    bench_fetch.add_argument("--count", type=int, default=MAX_THUMBNAILS_DISPLAY)
+    bench_fetch.add_argument("--latency", type=float, default=0.2, help="Stub server latency per request (seconds)")
+    bench_fetch.add_argument("--hosts", type=int, default=2, help="Number of stub hosts to spread thumbnails over")
+    bench_search = subparsers.add_parser("bench-search", help="Single-engine vs federated search against local engine stubs")
+    bench_search.add_argument("--latency", type=float, default=0.05)
+    bench_search.add_argument("--results", type=int, default=40, help="Results listed per engine")
+    bench_search.add_argument("--pictures", type=int, default=25, help="Distinct pictures behind those results")
+    bench = subparsers.add_parser("bench", help="Full benchmark suite (render option matrix + search), saved as JSON")
+    bench.add_argument("--out", default="benchmark_results.json", help="Results file")
+    bench.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    bench.add_argument("--resolution", default="540x960", help="Render resolution WxH")
+    bench.add_argument("--duration", type=float, default=8.0, help="Rendered video length (seconds)")
+    bench.add_argument("--fps", type=int, default=VIDEO_FPS)
+    bench.add_argument("--latency", type=float, default=0.05, help="Stub server latency for the search benchmarks")
+    bench.add_argument("--quick", action="store_true", help="Only a few option combinations")
+    bench_frames = subparsers.add_parser("bench-frames", help="Per-frame timing: MoviePy chain vs frame engine")
+    bench_frames.add_argument("--frames", type=int, default=24)
+    bench_frames.add_argument("--filter", default="Vintage", choices=["None", "Vintage", "Bright"])
+    args = parser.parse_args(argv)
+    if args.log_file:
+        event_bus.add_file_sink(args.log_file)
+
+    if args.command == "batch":
+        sys.exit(1 if run_batch(args.manifest, args.workers, args.log, args.preview, args.trace) else 0)
+    elif args.command == "project":
+        if args.action == "list":
+            for name in get_store().project_names():
+                urls, options = get_store().load_project(name)
+                print(f"{name}: {len(urls)} images, {options.get('profile', DEFAULT_PROFILE)} profile")
+        elif not args.name:
+            parser.error("project render needs a project name")
+        else:
+            sys.exit(0 if run_project(args.name, args.output, args.preview) else 1)
+    elif args.command == "bench-fetch":
+        run_fetch_benchmark(args.count, args.latency, args.hosts)
+    elif args.command == "bench-search":
+        run_search_benchmark(args.latency, args.results, args.pictures)
+    elif args.command == "bench":
+        resolution = tuple(int(side) for side in args.resolution.lower().split("x"))
+        run_benchmark_suite(args.out, resolution, args.duration, args.fps, args.latency, args.quick, args.compare)
+    elif args.command == "bench-frames":
+        run_frame_benchmark(frames=args.frames, filter_option=args.filter)
+    else:
+        setup_gui()
+
 if __name__ == "__main__":
-    setup_gui()
+    main()
@@ -0,0 +1,133 @@
+"""Search checks: URL normalization, the dHash threshold, every engine parser and federated
+search with paging, against the app's local engine stub (start_search_stub)."""
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+_spec = importlib.util.spec_from_file_location("app", os.path.join(os.path.dirname(__file__), os.pardir, "1.py"))
+app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(app)
+
+
+def image_with_dhash(image_hash, size=8):
+    """A (size + 1) x size grayscale image whose dhash() is exactly image_hash."""
+    bits = [(image_hash >> (size * size - 1 - n)) & 1 for n in range(size * size)]
+    rows = []
+    for y in range(size):
+        row = [128]
+        for bit in bits[y * size:(y + 1) * size]:
+            row.append(row[-1] + 10 if bit else row[-1] - 10)
+        rows.append(row)
+    return Image.fromarray(np.array(rows, dtype=np.uint8), "L")
+
+
+@pytest.fixture
+def search_stub(monkeypatch, tmp_path):
+    """Returns a function that starts a search stub and points every engine in SEARCH_ENGINES
+    at it, with a cold image cache and an empty in-memory index. DuckDuckGo keeps going
+    through search_duckduckgo; only the DDGS client underneath it reads the stub."""
+    servers = []
+
+    def start(results=40, pictures=25):
+        server = app.start_search_stub(0.0, results, pictures)
+        servers.append(server)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        class StubDDGS:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def images(self, keywords, region="wt-wt", safesearch="moderate", max_results=None, **filters):
+                response = app.get_http_session().get(f"{base}/ddg", params={"q": keywords, "count": max_results or 100},
+                                                      timeout=app.FETCH_TIMEOUT)
+                response.raise_for_status()
+                return [dict(item, title=keywords, source="Stub") for item in response.json()]
+
+        monkeypatch.setattr(app, "BING_API_KEY", "stub")
+        monkeypatch.setattr(app, "BING_ENDPOINT", f"{base}/bing")
+        monkeypatch.setattr(app, "BRAVE_ENDPOINT", f"{base}/brave")
+        monkeypatch.setattr(app, "DDGS", StubDDGS)
+        monkeypatch.setattr(app, "_image_cache", app.ImageCache(str(tmp_path / f"cache{len(servers)}")))
+        monkeypatch.setattr(app, "_store", (os.getpid(), app.ProjectStore(":memory:")))
+        with app._ddg_results_lock:
+            app._ddg_results.clear()
+        app.drain_image_queue()
+
+    yield start
+    with app._ddg_results_lock:
+        app._ddg_results.clear()
+    app.drain_image_queue()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("first, second", [
+    ("http://www.Example.com/a/b.jpg", "https://example.com/a/b.jpg/"),
+    ("https://example.com/a.jpg?w=1&h=2", "https://example.com/a.jpg?h=2&w=1#frag"),
+    ("https://example.com/a%20b.jpg", "https://example.com/a b.jpg"),
+    ("https://example.com/", "https://example.com"),
+])
+def test_normalize_url_same(first, second):
+    assert app.normalize_url(first) == app.normalize_url(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("https://example.com/a.jpg", "https://example.com/b.jpg"),
+    ("https://example.com/a.jpg?w=1", "https://example.com/a.jpg?w=2"),
+    ("https://example.com/a.jpg", "https://cdn.example.com/a.jpg"),
+])
+def test_normalize_url_different(first, second):
+    assert app.normalize_url(first) != app.normalize_url(second)
+
+
+BASE_HASH = 0x5A5A_F0F0_3C3C_9999
+
+
+def test_dhash_of_constructed_image():
+    assert app.dhash(image_with_dhash(BASE_HASH)) == BASE_HASH
+
+
+@pytest.mark.parametrize("distance", [0, app.DHASH_THRESHOLD, app.DHASH_THRESHOLD + 1, 20])
+def test_accept_threshold(distance):
+    deduper = app.ResultDeduper()
+    assert deduper.accept(image_with_dhash(BASE_HASH))
+    near = image_with_dhash(BASE_HASH ^ ((1 << distance) - 1))
+    assert deduper.accept(near) == (distance > app.DHASH_THRESHOLD)
+
+
+@pytest.mark.parametrize("engine", list(app.SEARCH_ENGINES))
+def test_engine_parses_results(search_stub, engine):
+    search_stub()
+    app.fetch_images_engine(engine, "stub")
+    items = app.drain_image_queue()
+    assert items
+    assert all(thumb_url and full_url for _, full_url, thumb_url in items)
+
+
+def test_all_engines_show_each_picture_once(search_stub):
+    results, pictures = 40, 25
+    search_stub(results, pictures)
+    search = app.fetch_images_all("stub")
+    shown = [app.stub_picture_of(thumb_url, pictures) for _, _, thumb_url in app.drain_image_queue()]
+    expected = {app.stub_picture_id(engine, i, pictures) for engine in ("bing", "brave", "ddg") for i in range(results)}
+    assert len(shown) == len(set(shown))
+    assert set(shown) == expected
+    assert search.dedupe.url_duplicates > 0
+    assert search.dedupe.image_duplicates > 0
+
+
+def test_paging_shows_each_picture_once(search_stub):
+    search_stub(200, 200)
+    search = app.SearchSession("stub", ["Brave", "DuckDuckGo"])
+    shown = []
+    while search.has_more:
+        app.fetch_images_page(search)
+        shown += [app.stub_picture_of(thumb_url, 200) for _, _, thumb_url in app.drain_image_queue()]
+    assert len(shown) == len(set(shown)) == 200